@@ -0,0 +1,82 @@
+# Copyright 2022 by Bas de Bruijne
+# All rights reserved.
+# Universal Wrapper comes with ABSOLUTELY NO WARRANTY, the writer can not be
+# held responsible for any problems caused by the use of this module.
+#
+# Spawns and reaps many short-lived processes with async calls and reports the
+# throughput and latency percentiles, with and without uw_settings.pidfd:
+# $ pip install -e .
+# $ python3 benchmarks/async_spawn.py -n 10000 -c 1000
+
+import argparse
+import asyncio
+import resource
+import time
+
+import universalwrapper as uw
+
+
+async def spawn(wrapper, count: int, concurrency: int) -> list:
+    """Runs count calls with at most concurrency calls in flight
+
+    :param wrapper: wrapped command to call
+    :param count: number of calls
+    :param concurrency: maximum number of processes alive at the same time
+    :returns: latency of every call in seconds
+    """
+    slots = asyncio.Semaphore(concurrency)
+
+    async def call():
+        async with slots:
+            start = time.monotonic()
+            await (await wrapper(_enable_async=True))
+            return time.monotonic() - start
+
+    return await asyncio.gather(*[call() for _ in range(count)])
+
+
+def report(name: str, latencies: list, duration: float) -> None:
+    """Prints throughput and latency percentiles
+
+    :param name: name of the run
+    :param latencies: latency of every call in seconds
+    :param duration: wall time of the run in seconds
+    """
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return latencies[min(int(len(latencies) * p / 100), len(latencies) - 1)] * 1000
+
+    print(
+        f"{name:8} {len(latencies) / duration:8.0f} calls/s  "
+        f"p50 {percentile(50):7.1f} ms  p99 {percentile(99):7.1f} ms  "
+        f"p99.9 {percentile(99.9):7.1f} ms  max {latencies[-1] * 1000:7.1f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="async spawn and reap benchmark")
+    parser.add_argument("-n", "--count", type=int, default=10000)
+    parser.add_argument("-c", "--concurrency", type=int, default=1000)
+    parser.add_argument("--cmd", default="true", help="command to spawn")
+    args = parser.parse_args()
+
+    # every call holds a pidfd and two pipes
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if args.concurrency * 4 > hard:
+        parser.error(f"concurrency needs {args.concurrency * 4} open files, max {hard}")
+
+    for name, pidfd in (("asyncio", False), ("pidfd", True)):
+        if pidfd and not uw._pidfd_supported():
+            print("pidfd    not supported on this system")
+            continue
+        wrapper = uw.UniversalWrapper(args.cmd)
+        wrapper.uw_settings.pidfd = pidfd
+        start = time.monotonic()
+        latencies = asyncio.run(spawn(wrapper, args.count, args.concurrency))
+        report(name, latencies, time.monotonic() - start)
+
+
+if __name__ == "__main__":
+    main()
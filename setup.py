@@ -15,6 +15,10 @@ setup(
   url = 'https://github.com/Basdbruijne/UniversalWrapper',
   keywords = ['wrapper', 'cli', 'subprocess'],
   install_requires = ['autothread', 'pyyaml'],
+  extras_require = {'numpy': ['numpy']},
+  entry_points = {
+    'console_scripts': ['uw-executor=universalwrapper.universal_wrapper:_executor_main'],
+  },
   classifiers=[  # Optional
     # How mature is this project? Common values are
     #   3 - Alpha
@@ -12,7 +12,14 @@
 # $ python3 -m coverage report --include universal_wrapper.py
 
 import asyncio
+import io
+import os
+import signal
+import socket
 import subprocess
+import tempfile
+import threading
+import time
 import unittest
 import universalwrapper
 
@@ -341,6 +348,101 @@ class TestUniversalWrapper(unittest.TestCase):
             "Generated command:\n['uw', 'test~run~runs', 'a', 'b', '--barbarfoo']"
         )
 
+    @patch("universalwrapper._arg_max")
+    @patch("universalwrapper.subprocess.Popen")
+    def test_chunk_args(self, mock_Popen, mock_arg_max):
+        uw_test = universalwrapper.uw_test
+        proc = Mock()
+        proc.communicate.return_value = (b"out\n", b"")
+        proc.returncode = 0
+        mock_Popen.return_value = proc
+        mock_arg_max.return_value = 64
+
+        output = uw_test.add("a", "b", "c", force=True, _chunk_args=True, _env={})
+        self.assertEqual(
+            [call.args[0] for call in mock_Popen.call_args_list],
+            [
+                ["uw-test", "add", "a", "b", "--force"],
+                ["uw-test", "add", "c", "--force"],
+            ],
+        )
+        self.assertEqual(output, "out\nout\n")
+
+        mock_Popen.reset_mock()
+        mock_arg_max.return_value = 10**6
+        uw_test.add("a", "b", "c", _chunk_args=True, _env={})
+        mock_Popen.assert_called_once_with(
+            ["uw-test", "add", "a", "b", "c"], stdout=ANY, stderr=ANY, cwd=None, env={}
+        )
+
+        mock_arg_max.return_value = 0
+        proc.returncode = 1
+        with self.assertRaises(universalwrapper.SubprocessErrorGroup) as context:
+            uw_test.add("a", "b", _chunk_args=True, _chunk_workers=2, _env={})
+        self.assertEqual(len(context.exception.errors), 2)
+        self.assertEqual(context.exception.outputs, [None, None])
+
+        proc.returncode = 0
+
+        async def run():
+            return await (await uw_test("a", "b", _chunk_args=True, _enable_async=True))
+
+        self.assertEqual(asyncio.run(run()), "out\nout\n")
+        output = uw_test("a", "b", _chunk_args=True, _parallel=True)
+        self.assertEqual(output, "out\nout\n")
+
+        output = uw_test("a", "b", _chunk_args=True, _output_parser="lines")
+        self.assertEqual(list(output), ["out", "out"])
+        with self.assertRaises(ValueError):
+            uw_test("a", "b", _chunk_args=True, _result="lazy")
+        proc.communicate.return_value = (b"NAME SIZE\ng     1\n", b"")
+        with patch("universalwrapper.numpy", None):
+            output = uw_test("a", "b", _chunk_args=True, _output_parser="table")
+        self.assertEqual(output, {"NAME": ["g", "g"], "SIZE": [1, 1]})
+
+        mock_arg_max.return_value = 10**6
+        output = uw_test("a", "b", _chunk_args=True, _result="lazy")
+        self.assertIsInstance(output, universalwrapper.CommandResult)
+        output = uw_test("a", "b", _chunk_args=True, _output_parser="lines")
+        self.assertIsInstance(output, universalwrapper.LineIndex)
+
+    @patch("universalwrapper.subprocess.Popen")
+    def test_fanout(self, mock_Popen):
+        uw_test = universalwrapper.uw_test
+
+        def popen(cmd, stdout, stderr, cwd, env):
+            if cwd == "missing":
+                raise FileNotFoundError(cwd)
+            proc = Mock()
+            proc.communicate.return_value = (cwd.encode(), b"")
+            proc.returncode = int(cwd == "b")
+            return proc
+
+        mock_Popen.side_effect = popen
+        output = uw_test.status(_cwd=["a", "b", "missing"])
+        self.assertEqual(output["a"], "a")
+        self.assertIsInstance(output["b"], universalwrapper.SubprocessError)
+        self.assertIsInstance(output["missing"], FileNotFoundError)
+        mock_Popen.assert_any_call(
+            ["uw-test", "status"], stdout=ANY, stderr=ANY, cwd="a", env=None
+        )
+
+        output = uw_test.status(_cwd="a", _env=[{"A": "1"}, {"A": "2"}])
+        self.assertEqual(output, {0: "a", 1: "a"})
+        mock_Popen.assert_any_call(
+            ["uw-test", "status"], stdout=ANY, stderr=ANY, cwd="a", env={"A": "2"}
+        )
+
+        with self.assertRaises(ValueError):
+            uw_test.status(_cwd=["a", "b"], _env=[{}])
+
+        async def run():
+            return await (await uw_test.status(_cwd=["a", "c"], _enable_async=True))
+
+        self.assertEqual(asyncio.run(run()), {"a": "a", "c": "c"})
+        output = uw_test.status(_cwd=["a", "c"], _parallel=True)
+        self.assertEqual(output, {"a": "a", "c": "c"})
+
     def test_change_settings(self):
         uw_test = universalwrapper.uw_test
         uw_test.uw_settings.debug = True
@@ -494,6 +596,77 @@ class TestUniversalWrapper(unittest.TestCase):
         result = uw_test()
         self.assertEqual(result, ["a", "b", "c"])
 
+    @patch("universalwrapper.subprocess.Popen")
+    def test_parse_lines(self, mock_Popen):
+        uw_test = universalwrapper.uw_test
+        proc = Mock()
+        proc.communicate.return_value = (b"a.py\nb.txt\r\nc.py\n", "")
+        proc.returncode = 0
+        mock_Popen.return_value = proc
+
+        uw_test.uw_settings.output_parser = "lines"
+        result = uw_test()
+        self.assertIsInstance(result, universalwrapper.LineIndex)
+        self.assertEqual(result, ["a.py", "b.txt", "c.py"])
+        self.assertEqual(len(result), 3)
+        self.assertEqual(result[1], "b.txt")
+        self.assertEqual(result[-1], "c.py")
+        self.assertEqual(list(result[1:]), ["b.txt", "c.py"])
+        self.assertEqual(result[::2], ["a.py", "c.py"])
+        self.assertEqual(result.grep(r"\.py$"), ["a.py", "c.py"])
+        self.assertEqual(result[1:].grep("py"), ["c.py"])
+        crlf = universalwrapper.LineIndex(b"a.py\r\nb$\r\n")
+        self.assertEqual(crlf.grep(r"\.py$"), ["a.py"])
+        self.assertEqual(crlf.grep(r"\$$"), ["b$"])
+        self.assertEqual(result.startswith("b"), ["b.txt"])
+        with self.assertRaises(IndexError):
+            result[3]
+
+    @patch("universalwrapper.numpy", None)
+    @patch("universalwrapper.subprocess.Popen")
+    def test_parse_table(self, mock_Popen):
+        uw_test = universalwrapper.uw_test
+        proc = Mock()
+        proc.communicate.return_value = (
+            b"""\
+CONTAINER ID   IMAGE     PORTS     SIZE    STATUS       Mounted on
+abcdef123456   nginx               1.5     Up 2 hours   /
+123456abcdef   redis               12      Exited (0)   /run
+""",
+            "",
+        )
+        proc.returncode = 0
+        mock_Popen.return_value = proc
+
+        uw_test.uw_settings.output_parser = "table"
+        result = uw_test()
+        self.assertEqual(
+            result,
+            {
+                "CONTAINER ID": ["abcdef123456", "123456abcdef"],
+                "IMAGE": ["nginx", "redis"],
+                "PORTS": ["", ""],
+                "SIZE": [1.5, 12.0],
+                "STATUS": ["Up 2 hours", "Exited (0)"],
+                "Mounted on": ["/", "/run"],
+            },
+        )
+
+        proc.communicate.return_value = (
+            b"""\
+USER         PID %CPU %MEM    VSZ   RSS TTY      STAT START   TIME COMMAND
+root           1  0.0  0.1  24108  9856 ?        Ss   15:44   0:09 /sbin/init
+bas         4242 12.5  1.7 5703132 279500 ?      Sl   15:44  10:01 python3 app.py
+""",
+            "",
+        )
+        result = uw_test()
+        self.assertEqual(list(result)[4:7], ["VSZ", "RSS", "TTY"])
+        self.assertEqual(result["VSZ"], [24108, 5703132])
+        self.assertEqual(result["RSS"], [9856, 279500])
+        self.assertEqual(result["TTY"], ["?", "?"])
+        self.assertEqual(result["COMMAND"], ["/sbin/init", "python3 app.py"])
+
     @patch("universalwrapper.subprocess.Popen")
     def test_parse_wrong_parser(self, mock_Popen):
         uw_test = universalwrapper.uw_test
@@ -507,6 +680,265 @@ class TestUniversalWrapper(unittest.TestCase):
         with self.assertRaises(ValueError):
             result = uw_test()
 
+    @patch("universalwrapper.json.loads")
+    @patch("universalwrapper.subprocess.Popen")
+    def test_lazy_result(self, mock_Popen, mock_loads):
+        uw_test = universalwrapper.uw_test
+        proc = Mock()
+        proc.communicate.return_value = (b'{"foo": "bar"}', b"")
+        proc.returncode = 0
+        mock_Popen.return_value = proc
+        mock_loads.return_value = {"foo": "bar"}
+
+        result = uw_test(_result="lazy", _output_parser="json")
+        self.assertIsInstance(result, universalwrapper.CommandResult)
+        mock_loads.assert_not_called()
+        self.assertTrue(result)
+        self.assertEqual(result.stdout, b'{"foo": "bar"}')
+        self.assertEqual(result.returncode, 0)
+        self.assertGreaterEqual(result.duration, 0)
+        self.assertEqual(result.json, {"foo": "bar"})
+        self.assertEqual(result.json, {"foo": "bar"})
+        mock_loads.assert_called_once()
+        self.assertEqual(result.text, '{"foo": "bar"}')
+        self.assertEqual(result.lines, ['{"foo": "bar"}'])
+        self.assertEqual(result.yaml, {"foo": "bar"})
+
+        with self.assertRaises(ValueError):
+            uw_test(_result="eager")
+
+    @patch("universalwrapper.subprocess.Popen")
+    def test_max_stderr_bytes(self, mock_Popen):
+        uw_test = universalwrapper.uw_test
+        proc = Mock()
+        proc.stdout = io.BytesIO(b"out")
+        proc.stderr = io.BytesIO(b"a" * 100000 + b"tail")
+        proc.returncode = 1
+        mock_Popen.return_value = proc
+
+        with self.assertRaises(universalwrapper.SubprocessError) as context:
+            uw_test(_max_stderr_bytes=10)
+        self.assertEqual(context.exception.stdout, b"out")
+        self.assertEqual(context.exception.stderr, b"aaaaaatail")
+        proc.communicate.assert_not_called()
+        self.assertEqual(context.exception.stderr.dropped, 99994)
+        self.assertIn("[99994 bytes dropped]\n| aaaaaatail", str(context.exception))
+
+        context.exception.stderr = b"a" * 10000 + b"tail"
+        message = str(context.exception)
+        self.assertIn("[5908 bytes omitted]", message)
+        self.assertTrue(message.endswith("atail\n"))
+        self.assertLess(len(message), 5000)
+
+    @patch("universalwrapper.subprocess.Popen")
+    def test_log_stderr(self, mock_Popen):
+        uw_test = universalwrapper.uw_test
+        proc = Mock()
+        proc.communicate.return_value = (b"out", b"noisy")
+        proc.returncode = 0
+        mock_Popen.return_value = proc
+
+        uw_test.uw_settings.log_stderr = True
+        with self.assertLogs("universalwrapper.universal_wrapper") as logs:
+            for _ in range(3):
+                self.assertEqual(uw_test.log(), "out")
+            uw_test.log(_log_stderr_interval=0)
+        self.assertEqual(len(logs.records), 2)
+        self.assertIn("noisy", logs.output[0])
+        self.assertIn("repeated 2 times", logs.output[1])
+
+    @patch.dict("universalwrapper._WHICH_CACHE", clear=True)
+    @patch("universalwrapper.UniversalWrapper._raise_or_return")
+    @patch("universalwrapper.shutil.which")
+    @patch("universalwrapper.subprocess.Popen")
+    def test_resolve_executable(self, mock_Popen, mock_which, mock_raise_or_return):
+        uw_test = universalwrapper.uw_test
+        proc = Mock()
+        proc.communicate.return_value = (b"", b"")
+        mock_Popen.return_value = proc
+        mock_which.return_value = "/opt/bin/uw-test"
+
+        uw_test.uw_settings.resolve_executable = True
+        uw_test.run()
+        uw_test.run()
+        mock_which.assert_called_once_with("uw-test", path=ANY)
+        mock_Popen.assert_called_with(
+            ["/opt/bin/uw-test", "run"], stdout=ANY, stderr=ANY, cwd=None, env=None
+        )
+        mock_raise_or_return.assert_called_with(ANY, ANY, ANY, ["uw-test", "run"], ANY)
+
+        uw_test.run(_env={"PATH": "/opt/bin"})
+        mock_which.assert_called_with("uw-test", path="/opt/bin")
+        self.assertEqual(mock_which.call_count, 2)
+
+        mock_Popen.reset_mock()
+        mock_which.return_value = None
+        with self.assertRaises(FileNotFoundError):
+            uw_test.run(_env={"PATH": "/nonexistent"})
+        mock_Popen.assert_not_called()
+
+    @patch.dict("universalwrapper.os.environ", {"HOME": "/home/uw"}, clear=True)
+    @patch("universalwrapper.UniversalWrapper._raise_or_return")
+    @patch("universalwrapper.subprocess.Popen")
+    def test_env_overlay(self, mock_Popen, mock_raise_or_return):
+        uw_test = universalwrapper.uw_test
+        proc = Mock()
+        proc.communicate.return_value = (b"", b"")
+        mock_Popen.return_value = proc
+
+        uw_test.uw_settings.env_overlay = {"FOO": "bar"}
+        uw_test()
+        env = mock_Popen.call_args.kwargs["env"]
+        self.assertEqual(env, {"HOME": "/home/uw", "FOO": "bar"})
+        uw_test()
+        self.assertIs(mock_Popen.call_args.kwargs["env"], env)
+
+        universalwrapper.os.environ["HOME"] = "/root"
+        uw_test()
+        self.assertEqual(
+            mock_Popen.call_args.kwargs["env"], {"HOME": "/root", "FOO": "bar"}
+        )
+
+        uw_test(_env={"PATH": "/bin"})
+        self.assertEqual(
+            mock_Popen.call_args.kwargs["env"], {"PATH": "/bin", "FOO": "bar"}
+        )
+
+    @patch("universalwrapper._help_cache_path")
+    @patch("universalwrapper.subprocess.Popen")
+    def test_help_cache(self, mock_Popen, mock_help_cache_path):
+        uw_test = universalwrapper.uw_test
+        proc = Mock()
+        proc.communicate.return_value = (
+            b"""\
+usage: uw-test remote [-v | --verbose]
+   or: uw-test remote set-url <name> <url>
+
+  add          Add a remote
+  rename       Rename a remote
+""",
+            b"",
+        )
+        proc.returncode = 0
+        mock_Popen.return_value = proc
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            mock_help_cache_path.return_value = os.path.join(cache_dir, "help.json")
+            self.assertNotIn("rename", dir(uw_test.remote))
+            mock_Popen.assert_not_called()
+
+            self.assertIn("Rename a remote", uw_test.remote.__doc__)
+            mock_Popen.assert_called_once_with(
+                ["uw-test", "remote", "--help"],
+                stdout=ANY,
+                stderr=ANY,
+                cwd=None,
+                env=None,
+            )
+            index = universalwrapper.help_index(uw_test.remote)
+            self.assertEqual(index.subcommands, ["add", "rename", "set-url"])
+            self.assertEqual(index.flags, ["--verbose", "-v"])
+            self.assertIn("rename", index)
+            self.assertEqual(index.complete("--v"), ["--verbose"])
+            self.assertIn("set_url", dir(uw_test.remote))
+            mock_Popen.assert_called_once()
+
+            uw_test.uw_settings.help_cache = False
+            uw_test.remote.__doc__
+            self.assertEqual(mock_Popen.call_count, 2)
+
+    def test_incremental(self):
+        from universalwrapper import cat
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cat.uw_settings.cache_dir = os.path.join(tmp, "cache")
+            cat.uw_settings.cwd = tmp
+            with open(os.path.join(tmp, "in.txt"), "w") as file:
+                file.write("foo")
+
+            with patch(
+                "universalwrapper.subprocess.Popen", wraps=subprocess.Popen
+            ) as mock_Popen:
+                self.assertEqual(cat("in.txt", _inputs=["in.txt"]), "foo")
+                self.assertEqual(cat("in.txt", _inputs=["in.txt"]), "foo")
+                self.assertEqual(mock_Popen.call_count, 1)
+
+                with open(os.path.join(tmp, "in.txt"), "w") as file:
+                    file.write("bar")
+                self.assertEqual(cat("in.txt", _inputs=["in.txt"]), "bar")
+                self.assertEqual(mock_Popen.call_count, 2)
+
+                cat("in.txt", _inputs=["in.txt"], _outputs=["out.txt"])
+                cat("in.txt", _inputs=["in.txt"], _outputs=["out.txt"])
+                self.assertEqual(mock_Popen.call_count, 3)
+                with open(os.path.join(tmp, "out.txt"), "w") as file:
+                    file.write("changed")
+                cat("in.txt", _inputs=["in.txt"], _outputs=["out.txt"])
+                self.assertEqual(mock_Popen.call_count, 4)
+
+                cat("in.txt")
+                cat("in.txt")
+                self.assertEqual(mock_Popen.call_count, 6)
+
+            from universalwrapper import printenv
+
+            printenv.uw_settings.cache_dir = os.path.join(tmp, "cache")
+            printenv.uw_settings.cwd = tmp
+            envs = [{"A": "1"}, {"A": "2"}]
+            for _ in range(2):
+                output = printenv("A", _env=envs, _inputs=["in.txt"])
+                self.assertEqual(output, {0: "1\n", 1: "2\n"})
+            output = printenv("PATH", _env=os.environ, _inputs=["in.txt"])
+            self.assertEqual(output, os.environ["PATH"] + "\n")
+            env = dict(os.environ, A="3")
+            self.assertEqual(printenv("A", _env=env, _inputs=["in.txt"]), "3\n")
+            self.assertEqual(
+                printenv("A", _env_overlay={"A": "4"}, _inputs=["in.txt"]), "4\n"
+            )
+
+    @patch("universalwrapper.subprocess.Popen")
+    def test_graph(self, mock_Popen):
+        from universalwrapper import uw_test
+
+        def popen(cmd, stdout, stderr, cwd, env):
+            proc = Mock()
+            proc.communicate.return_value = (" ".join(cmd[1:]).encode(), b"")
+            proc.returncode = int("fail" in cmd)
+            return proc
+
+        mock_Popen.side_effect = popen
+        graph = universalwrapper.Graph(max_workers=2)
+        build = graph.add(uw_test.build, ".", tag="app")
+        pushes = [
+            graph.add(uw_test.push, registry, _after=[build]) for registry in "ab"
+        ]
+        deploy = graph.add(uw_test.deploy, _after=pushes, _name="deploy")
+        results = graph.run()
+        self.assertEqual(results[build], "build . --tag app")
+        self.assertEqual(results[deploy], "deploy")
+        self.assertEqual(mock_Popen.call_count, 4)
+        path = graph.critical_path()
+        self.assertEqual(path[0], build)
+        self.assertIn(path[1], pushes)
+        self.assertEqual(path[2], deploy)
+        self.assertIn("* deploy: ", graph.summary())
+
+        mock_Popen.reset_mock()
+        graph = universalwrapper.Graph()
+        build = graph.add(uw_test.build, "fail")
+        other = graph.add(uw_test.other)
+        push = graph.add(uw_test.push, _after=[build])
+        deploy = graph.add(uw_test.deploy, _after=[push, other])
+        with self.assertRaises(universalwrapper.GraphError) as context:
+            graph.run()
+        self.assertEqual(context.exception.failed, [build])
+        self.assertEqual(context.exception.cancelled, [push, deploy])
+        self.assertEqual(other.state, "done")
+        self.assertEqual(mock_Popen.call_count, 2)
+
+        with self.assertRaises(ValueError):
+            universalwrapper.Graph().add(uw_test.deploy, _after=[build])
+
     def test_load_settings(self):
         uw_test = universalwrapper.uw_test
         uw_test.uw_settings.divider = " "
@@ -521,20 +953,19 @@ class TestUniversalWrapper(unittest.TestCase):
         proc.returncode = 0
         proc.communicate.return_value = (b"output", b"")
         mock_cse.return_value = proc
+        kwargs = dict(cwd=None, env=None, **universalwrapper._PROCESS_GROUP)
 
         uw_test = universalwrapper.uw_test
         output = await uw_test.test(_enable_async=True)
         await output
-        mock_cse.assert_called_with(
-            "uw-test", "test", stdout=ANY, stderr=ANY, cwd=None, env=None
-        )
+        mock_cse.assert_called_with("uw-test", "test", stdout=ANY, stderr=ANY, **kwargs)
 
         uw_test = universalwrapper.uw_test
         uw_test.uw_settings.enable_async = True
         output = await uw_test.test2(_enable_async=True)
         await output
         mock_cse.assert_called_with(
-            "uw-test", "test2", stdout=ANY, stderr=ANY, cwd=None, env=None
+            "uw-test", "test2", stdout=ANY, stderr=ANY, **kwargs
         )
 
         uw_test = universalwrapper.uw_test
@@ -542,7 +973,7 @@ class TestUniversalWrapper(unittest.TestCase):
         output = await uw_test.test3()
         await output
         mock_cse.assert_called_with(
-            "uw-test", "test3", stdout=ANY, stderr=ANY, cwd=None, env=None
+            "uw-test", "test3", stdout=ANY, stderr=ANY, **kwargs
         )
 
         uw_test = universalwrapper.uw_test
@@ -550,7 +981,7 @@ class TestUniversalWrapper(unittest.TestCase):
         output = await uw_test.a.b.c(_enable_async=True)
         await output
         mock_cse.assert_called_with(
-            "uw-test", "a", "b", "c", stdout=ANY, stderr=ANY, cwd=None, env=None
+            "uw-test", "a", "b", "c", stdout=ANY, stderr=ANY, **kwargs
         )
 
         proc.returncode = 1
@@ -560,6 +991,44 @@ class TestUniversalWrapper(unittest.TestCase):
             output = await uw_test.a.b.c(_enable_async=True)
             await output
 
+    @patch("universalwrapper._parse_pool", wraps=universalwrapper._parse_pool)
+    @patch("universalwrapper.subprocess.Popen")
+    def test_parse_offload(self, mock_Popen, mock_parse_pool):
+        uw_test = universalwrapper.uw_test
+        proc = Mock()
+        proc.communicate.return_value = (b'{"foo": "bar"}', b"")
+        proc.returncode = 0
+        mock_Popen.return_value = proc
+
+        uw_test.uw_settings.output_parser = "json"
+        uw_test.uw_settings.parse_offload = 1000
+        self.assertEqual(uw_test(), {"foo": "bar"})
+        mock_parse_pool.assert_not_called()
+
+        self.assertEqual(uw_test(_parse_offload=10), {"foo": "bar"})
+        mock_parse_pool.assert_called_with("thread")
+
+        with self.assertRaises(ValueError):
+            uw_test(_parse_offload=10, _parse_pool="fiber")
+
+    def test_async_parse_offload(self):
+        asyncio.run(self._test_async_parse_offload())
+
+    @patch("universalwrapper._parse_pool", wraps=universalwrapper._parse_pool)
+    @patch("universalwrapper.asyncio.create_subprocess_exec")
+    async def _test_async_parse_offload(self, mock_cse, mock_parse_pool):
+        proc = AsyncMock()
+        proc.returncode = 0
+        proc.communicate.return_value = (b"- foo\n- bar\n", b"")
+        mock_cse.return_value = proc
+
+        uw_test = universalwrapper.uw_test
+        output = await uw_test(
+            _enable_async=True, _output_parser="yaml", _parse_offload=1
+        )
+        self.assertEqual(await output, ["foo", "bar"])
+        mock_parse_pool.assert_called_with("thread")
+
     def test_basic_commands(self):
         from universalwrapper import ls, mkdir, touch, rm, grep
 
@@ -631,6 +1100,442 @@ class TestUniversalWrapper(unittest.TestCase):
         rm("__uwunittest", recursive=True)
         self.assertTrue("__uwunittest" not in ls(_enable_async=False))
 
+    def test_timeout(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            script = os.path.join(tmp, "slow.sh")
+            with open(script, "w") as file:
+                file.write("#!/bin/sh\necho partial\nsleep 10 &\nwait\n")
+            os.chmod(script, 0o755)
+            slow = universalwrapper.UniversalWrapper("./slow.sh")
+            slow.uw_settings.cwd = tmp
+            slow.uw_settings.timeout_grace = 1
+
+            start = time.monotonic()
+            with self.assertRaises(universalwrapper.SubprocessTimeoutError) as error:
+                slow(_timeout=0.5)
+            self.assertLess(time.monotonic() - start, 5)
+            self.assertEqual(error.exception.stdout, b"partial\n")
+            self.assertEqual(error.exception.timeout, 0.5)
+            self.assertIn("timed out after 0.5 seconds", str(error.exception))
+
+            slow.uw_settings.max_stderr_bytes = 16
+            with self.assertRaises(universalwrapper.SubprocessTimeoutError) as error:
+                slow(_timeout=0.5)
+            self.assertEqual(error.exception.stdout, b"partial\n")
+
+            async def run():
+                return await (await slow(_timeout=0.5, _enable_async=True))
+
+            start = time.monotonic()
+            with self.assertRaises(universalwrapper.SubprocessTimeoutError) as error:
+                asyncio.run(run())
+            self.assertLess(time.monotonic() - start, 5)
+            self.assertEqual(error.exception.stdout, b"partial\n")
+
+            graph = universalwrapper.Graph()
+            graph.add(slow)
+            with self.assertRaises(universalwrapper.GraphError):
+                graph.run(timeout=0.5)
+
+            sleep = universalwrapper.UniversalWrapper("sleep")
+            background = sleep(0.5, _parallel=True)
+            with self.assertRaises(universalwrapper.SubprocessTimeoutError):
+                sleep(10, _timeout=0.1)
+            self.assertEqual(background, "")
+
+            with patch("universalwrapper.subprocess.Popen") as mock_Popen:
+                with self.assertRaises(
+                    universalwrapper.SubprocessTimeoutError
+                ) as error:
+                    slow(_timeout=0)
+                mock_Popen.assert_not_called()
+            self.assertIsNone(error.exception.returncode)
+            self.assertEqual(
+                str(error.exception),
+                "Command '['./slow.sh']' timed out after 0 seconds:\n",
+            )
+            graph = universalwrapper.Graph()
+            graph.add(slow, _timeout=0)
+            with self.assertRaises(universalwrapper.GraphError) as error:
+                graph.run()
+            self.assertIn("timed out after 0 seconds", str(error.exception))
+
+    @unittest.skipUnless(os.path.exists("/proc/self/stat"), "needs /proc")
+    def test_async_cancel(self):
+        def alive(pid):
+            try:
+                with open(f"/proc/{pid}/stat") as file:
+                    return file.read().rsplit(")", 1)[1].split()[0] != "Z"
+            except FileNotFoundError:
+                return False
+
+        with tempfile.TemporaryDirectory() as tmp:
+            script = os.path.join(tmp, "slow.sh")
+            with open(script, "w") as file:
+                file.write("#!/bin/sh\nsleep 10 &\necho $! > child.pid\nwait\n")
+            os.chmod(script, 0o755)
+            slow = universalwrapper.UniversalWrapper("./slow.sh")
+            slow.uw_settings.cwd = tmp
+            slow.uw_settings.timeout_grace = 1
+            pid_file = os.path.join(tmp, "child.pid")
+
+            async def run(pidfd, started):
+                task = asyncio.ensure_future(
+                    await slow(_enable_async=True, _pidfd=pidfd)
+                )
+                while not os.path.exists(pid_file) or not os.path.getsize(pid_file):
+                    if started:
+                        await asyncio.sleep(0.01)
+                    else:  # cancel the output before it was first awaited
+                        time.sleep(0.01)
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+                with open(pid_file) as file:
+                    pid = int(file.read())
+                deadline = time.monotonic() + 2
+                while alive(pid) and time.monotonic() < deadline:
+                    await asyncio.sleep(0.01)
+                self.assertFalse(alive(pid))
+                await asyncio.sleep(0.1)  # the script exits as well
+                os.unlink(pid_file)
+
+            for pidfd in (False, True):
+                for started in (False, True):
+                    asyncio.run(run(pidfd, started))
+
+    def test_executor(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            address = f"unix://{tmp}/uw.sock"
+            with universalwrapper.ExecutorServer(address, max_workers=2, cache_ttl=60):
+                echo = universalwrapper.UniversalWrapper("echo")
+                echo.uw_settings.executor = address
+                self.assertEqual(echo("foo"), "foo\n")
+
+                async def run():
+                    return await (await echo("bar", _enable_async=True))
+
+                self.assertEqual(asyncio.run(run()), "bar\n")
+
+                date = universalwrapper.UniversalWrapper("date")
+                date.uw_settings.executor = address
+                self.assertEqual(date("+%N"), date("+%N"))
+
+                false = universalwrapper.UniversalWrapper("false")
+                false.uw_settings.executor = address
+                with self.assertRaises(universalwrapper.SubprocessError):
+                    false()
+
+                missing = universalwrapper.UniversalWrapper("uw-missing-command")
+                missing.uw_settings.executor = address
+                with self.assertRaises(FileNotFoundError):
+                    missing()
+
+                sleep = universalwrapper.UniversalWrapper("sleep")
+                sleep.uw_settings.executor = address
+                with self.assertRaises(universalwrapper.SubprocessTimeoutError):
+                    sleep(10, _timeout=0.2)
+
+                with self.assertRaises(OSError):
+                    universalwrapper.ExecutorServer(address).start()
+            self.assertFalse(os.path.exists(f"{tmp}/uw.sock"))
+
+            with open(f"{tmp}/uw.sock", "w"):
+                pass  # not a socket, must be left alone
+            with self.assertRaises(FileExistsError):
+                universalwrapper.ExecutorServer(address).start()
+            self.assertTrue(os.path.exists(f"{tmp}/uw.sock"))
+            os.unlink(f"{tmp}/uw.sock")
+
+            stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            stale.bind(f"{tmp}/uw.sock")
+            stale.close()  # stale socket file of a crashed daemon
+            server = universalwrapper.ExecutorServer(
+                address, cache_ttl=60, cache_bytes=10
+            )
+            with server:
+                echo = universalwrapper.UniversalWrapper("echo")
+                echo.uw_settings.executor = address
+                for word in ("foo", "bar", "baz"):
+                    self.assertEqual(echo(word), f"{word}\n")
+                self.assertEqual(len(server._cache), 2)
+                self.assertLessEqual(server._cache_size, 10)
+
+    def test_record_replay(self):
+        from universalwrapper import uw_test
+
+        with tempfile.TemporaryDirectory() as tmp:
+            uw_test.uw_settings.fixture = os.path.join(tmp, "calls.jsonl.gz")
+            uw_test.uw_settings.fixture_env = ["UW_TEST"]
+
+            uw_test.uw_settings.backend = "record"
+            with patch("universalwrapper.subprocess.Popen") as mock_Popen:
+                mock_Popen.return_value.communicate.side_effect = [
+                    (b"first\xff", b""),
+                    (b"second", b""),
+                    (b"", b"error"),
+                ]
+                mock_Popen.return_value.returncode = 0
+                self.assertEqual(uw_test("foo", _result="lazy").stdout, b"first\xff")
+                self.assertEqual(uw_test("foo"), "second")
+                mock_Popen.return_value.returncode = 1
+                with self.assertRaises(universalwrapper.SubprocessError):
+                    uw_test("bar")
+
+            uw_test.uw_settings.backend = "replay"
+            with patch("universalwrapper.subprocess.Popen") as mock_Popen:
+                self.assertEqual(uw_test("foo", _result="lazy").stdout, b"first\xff")
+                self.assertEqual(uw_test("foo"), "second")
+                self.assertEqual(uw_test("foo"), "second")
+                with self.assertRaises(universalwrapper.SubprocessError):
+                    uw_test("bar")
+                with self.assertRaises(LookupError):
+                    uw_test("baz")
+                with self.assertRaises(LookupError):
+                    uw_test("foo", _env_overlay={"UW_TEST": "1"})
+                mock_Popen.assert_not_called()
+
+    @unittest.skipUnless(universalwrapper._pidfd_supported(), "requires pidfd_open")
+    def test_pidfd(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            script = os.path.join(tmp, "noisy.sh")
+            with open(script, "w") as file:
+                file.write("#!/bin/sh\necho out\necho err >&2\nexit $1\n")
+            os.chmod(script, 0o755)
+            noisy = universalwrapper.UniversalWrapper("./noisy.sh")
+            noisy.uw_settings.cwd = tmp
+            noisy.uw_settings.pidfd = True
+            noisy.uw_settings.warn_stderr = False
+            sleep = universalwrapper.UniversalWrapper("sleep")
+            sleep.uw_settings.pidfd = True
+
+            async def run():
+                outputs = await asyncio.gather(
+                    *[await noisy(0, _enable_async=True) for _ in range(20)]
+                )
+                self.assertEqual(outputs, ["out\n"] * 20)
+                with self.assertRaises(universalwrapper.SubprocessError) as error:
+                    await (await noisy(3, _enable_async=True))
+                self.assertEqual(error.exception.returncode, 3)
+                self.assertEqual(error.exception.stderr, b"err\n")
+                with self.assertRaises(universalwrapper.SubprocessTimeoutError):
+                    await (await sleep(10, _enable_async=True, _timeout=0.2))
+
+            with patch("universalwrapper.asyncio.create_subprocess_exec") as mock_exec:
+                asyncio.run(run())
+                mock_exec.assert_not_called()
+
+    def test_reactor(self):
+        from concurrent.futures import wait
+
+        echo = universalwrapper.UniversalWrapper("echo")
+        echo.uw_settings.parallel = True
+        echo.uw_settings.reactor = True
+        sleep = universalwrapper.UniversalWrapper("sleep")
+        sleep.uw_settings.parallel = True
+        sleep.uw_settings.reactor = True
+
+        start = time.monotonic()
+        sleeps = [sleep(0.5) for _ in range(50)]
+        outputs = [echo(i) for i in range(200)]
+        self.assertEqual(outputs, [f"{i}\n" for i in range(200)])
+        self.assertIsInstance(outputs[0], universalwrapper.ParallelCall)
+        self.assertEqual(outputs[0].splitlines(), ["0"])
+        self.assertEqual(echo("foo", _output_parser="splitlines")[0], "foo")
+        wait(sleeps)
+        self.assertLess(time.monotonic() - start, 5)
+
+        with self.assertRaises(universalwrapper.SubprocessTimeoutError):
+            sleep(10, _timeout=0.2).result()
+        false = universalwrapper.UniversalWrapper("false")
+        call = false(_parallel=True, _reactor=True)
+        self.assertIsInstance(call.exception(), universalwrapper.SubprocessError)
+        missing = universalwrapper.UniversalWrapper("uw-missing-command")
+        with self.assertRaises(FileNotFoundError):
+            missing(_parallel=True, _reactor=True).result()
+
+        threads = []
+        raise_or_return = universalwrapper.UniversalWrapper._raise_or_return
+
+        def parse(*args, **kwargs):
+            threads.append(threading.current_thread())
+            return raise_or_return(*args, **kwargs)
+
+        with patch("universalwrapper.UniversalWrapper._raise_or_return", parse):
+            call = echo("foo")
+            wait([call])
+            self.assertEqual(threads, [])  # the reactor does not parse the output
+            self.assertEqual(call.result(), "foo\n")
+            self.assertEqual(call.result(), "foo\n")
+        self.assertEqual(threads, [threading.current_thread()])
+
+    def test_reactor_cancel(self):
+        sleep = universalwrapper.UniversalWrapper("sleep")
+        sleep.uw_settings.parallel = True
+        sleep.uw_settings.reactor = True
+        sleep.uw_settings.limit_key = "uw-test-cancel"
+        sleep.uw_settings.max_in_flight = 1
+
+        start = time.monotonic()
+        call = sleep(10)
+        self.assertEqual(repr(call), "<ParallelCall pending>")
+        self.assertTrue(call.cancel())
+        self.assertEqual(repr(call), "<ParallelCall cancelled>")
+        self.assertEqual(sleep(0, _timeout=5), "")
+        self.assertLess(time.monotonic() - start, 5)
+
+        echo = universalwrapper.UniversalWrapper("echo")
+        echo.uw_settings.parallel = True
+        echo.uw_settings.reactor = True
+        with patch("universalwrapper._Reactor._read", side_effect=OSError("broken")):
+            call = echo("foo")
+            self.assertIsInstance(call.exception(5), OSError)
+        self.assertEqual(repr(call), "<ParallelCall failed with OSError>")
+        self.assertEqual(echo("bar"), "bar\n")
+
+    def test_limits(self):
+        sleep = universalwrapper.UniversalWrapper("sleep")
+        sleep.uw_settings.limit_key = "uw-test-sleep"
+        sleep.uw_settings.max_in_flight = 2
+        limiter = universalwrapper._shared_limiter("uw-test-sleep")
+
+        start = time.monotonic()
+        calls = [sleep(0.2, _parallel=True, _reactor=True) for _ in range(6)]
+        self.assertLessEqual(limiter.in_flight, 2)
+        [call.result() for call in calls]
+        self.assertGreaterEqual(time.monotonic() - start, 0.6)
+        self.assertEqual(limiter.in_flight, 0)
+
+        async def run():
+            return await asyncio.gather(
+                *[await sleep(0.2, _enable_async=True) for _ in range(4)]
+            )
+
+        start = time.monotonic()
+        asyncio.run(run())
+        self.assertGreaterEqual(time.monotonic() - start, 0.4)
+        self.assertEqual(limiter.in_flight, 0)
+
+        calls = [sleep(0.5, _parallel=True, _reactor=True) for _ in range(2)]
+        while limiter.in_flight < 2:  # the reactor starts the queued calls
+            time.sleep(0.01)
+        with self.assertRaises(universalwrapper.SubprocessTimeoutError):
+            sleep(0, _timeout=0.1)
+        [call.result() for call in calls]
+
+        echo = universalwrapper.UniversalWrapper("echo")
+        echo.uw_settings.rate_limit = 20
+        start = time.monotonic()
+        self.assertEqual(
+            [echo(i) for i in range(5)], ["0\n", "1\n", "2\n", "3\n", "4\n"]
+        )
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    def test_reactor_limits(self):
+        sleep = universalwrapper.UniversalWrapper("sleep")
+        sleep.uw_settings.parallel = True
+        sleep.uw_settings.reactor = True
+        sleep.uw_settings.limit_key = "uw-test-queue"
+        sleep.uw_settings.max_in_flight = 1
+        limiter = universalwrapper._shared_limiter("uw-test-queue")
+
+        start = time.monotonic()
+        calls = [sleep(0.2) for _ in range(3)]
+        queued = sleep(0.2)
+        late = sleep(10, _timeout=0.3)
+        self.assertLess(time.monotonic() - start, 0.2)
+        self.assertTrue(queued.cancel())
+        self.assertEqual(calls, ["", "", ""])
+        self.assertGreaterEqual(time.monotonic() - start, 0.6)
+        self.assertIsInstance(late.exception(), universalwrapper.SubprocessTimeoutError)
+        self.assertEqual(limiter.in_flight, 0)
+
+        limiter.acquire()
+        threading.Timer(0.1, limiter.release, (0, False)).start()
+
+        async def run():
+            return await limiter.async_acquire(5)
+
+        start = time.monotonic()
+        asyncio.run(run())
+        self.assertLess(time.monotonic() - start, 1)
+        limiter.release(0, False)
+
+    def test_adaptive_limits(self):
+        limiter = universalwrapper._Limiter()
+        limiter.configure(8, 0, 1, True)
+
+        def call(latency=0.1, failed=False):
+            limiter.acquire()
+            limiter.release(time.monotonic() - latency, failed)
+
+        self.assertEqual(limiter.limit, 1)
+        for _ in range(10):
+            call()
+        self.assertEqual(limiter.limit, 8)
+
+        call(latency=1)
+        self.assertEqual(limiter.limit, 4)
+
+        admitted = [limiter.acquire() for _ in range(4)]
+        for started in admitted:
+            limiter.release(started, True)
+        self.assertEqual(limiter.limit, 2)
+        for _ in range(40):
+            call()
+        self.assertEqual(limiter.limit, 8)
+        with self.assertRaises(TimeoutError):
+            [limiter.acquire(0.01) for _ in range(9)]
+
+    def test_limits_shared_key(self):
+        limiter = universalwrapper._Limiter()
+        start = time.monotonic()
+        for rate in (20, 30, 20, 30, 20, 30):
+            limiter.configure(0, rate, 1, False)
+            limiter.release(limiter.acquire(), False)
+        self.assertGreaterEqual(time.monotonic() - start, 5 / 30)
+
+        sleep = universalwrapper.UniversalWrapper("sleep")
+        sleep.uw_settings.limit_key = "uw-test-cancel-adaptive"
+        sleep.uw_settings.adaptive = True
+        limiter = universalwrapper._shared_limiter("uw-test-cancel-adaptive")
+
+        async def run():
+            await (await sleep(0, _enable_async=True))
+            task = asyncio.ensure_future(await sleep(10, _enable_async=True))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            await asyncio.sleep(0.1)  # the process exits
+
+        asyncio.run(run())
+        self.assertEqual(limiter.limit, 2)
+        self.assertEqual(limiter.in_flight, 0)
+
+    @patch("universalwrapper._signal")
+    @patch("universalwrapper.subprocess.Popen")
+    def test_timeout_interrupted(self, mock_Popen, mock_signal):
+        uw_test = universalwrapper.uw_test
+        proc = Mock()
+        proc.communicate.side_effect = KeyboardInterrupt
+        proc.wait.side_effect = [subprocess.TimeoutExpired("uw-test", 0), 0]
+        mock_Popen.return_value = proc
+
+        with self.assertRaises(KeyboardInterrupt):
+            uw_test(_timeout=10, _timeout_grace=0)
+        for key, value in universalwrapper._PROCESS_GROUP.items():
+            self.assertEqual(mock_Popen.call_args.kwargs[key], value)
+        mock_signal.assert_any_call(proc, signal.SIGTERM, True)
+        mock_signal.assert_any_call(proc, universalwrapper._SIGKILL, True)
+
+        mock_signal.reset_mock()
+        proc.stdout, proc.stderr = io.BytesIO(), io.BytesIO()
+        proc.wait.side_effect = [KeyboardInterrupt, 0, 0]
+        with self.assertRaises(KeyboardInterrupt):
+            uw_test(_timeout=10, _max_stderr_bytes=16)
+        mock_signal.assert_any_call(proc, signal.SIGTERM, True)
+
 
 if __name__ == "__main__":
     unittest.main()
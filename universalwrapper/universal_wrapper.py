@@ -5,14 +5,77 @@
 
 import asyncio
 import autothread
+import bisect
+import concurrent.futures
 import copy
+import errno
+import gzip
+import hashlib
+import io
 import json
+import logging
+import os
+import re
+import selectors
 import shlex
+import shutil
+import signal
+import socket
+import sqlite3
+import stat
+import struct
 import subprocess
+import sys
+import time
 import warnings
 import yaml
 
-from typing import ByteString, Union, List, Dict
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from array import array
+from contextlib import closing
+from collections.abc import Sequence
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from threading import Condition, Lock, Semaphore, Thread
+from types import MappingProxyType
+from typing import ByteString, Iterator, Union, List, Dict
+
+_ARGS_PLACEHOLDER = "\x00uw-args\x00"  # Marks where chunked arguments are inserted
+_PARSE_POOLS = {}  # {"thread" or "process": pool shared by all wrappers}
+_PARSE_POOLS_LOCK = Lock()
+_WHICH_CACHE = {}  # {(command, PATH): absolute path of the executable}
+_ENV_CACHE = {}  # {overlay items: (os.environ snapshot, merged env)}
+_SIGKILL = getattr(signal, "SIGKILL", signal.SIGTERM)
+# Starts a subprocess in its own process group. Unlike start_new_session, this keeps
+# the subprocess in the session of the caller, with the same controlling terminal.
+if sys.version_info >= (3, 11):
+    _PROCESS_GROUP = {"process_group": 0}
+elif hasattr(os, "setpgrp"):
+    _PROCESS_GROUP = {"preexec_fn": os.setpgrp}
+else:
+    _PROCESS_GROUP = {}
+_FIXTURES = {}  # {(abs path, backend): _Fixture}
+_PIDFD_SUPPORTED = None  # Whether os.pidfd_open works, probed on first use
+_REACTOR = None  # _Reactor shared by all wrappers, started on first use
+_LIMITERS = {}  # {limit_key: _Limiter shared by all wrappers}
+_LIMITERS_LOCK = Lock()
+_REACTOR_LOCK = Lock()
+_FIXTURES_LOCK = Lock()
+_FRAME = struct.Struct("!cI")  # Executor protocol: kind of the frame, payload size
+# Raised when a cancelled future is resolved, Python 3.7 raises no exception at all
+_INVALID_STATE = getattr(concurrent.futures, "InvalidStateError", RuntimeError)
+
+logger = logging.getLogger(__name__)
 
 
 class UWSettings:
@@ -46,11 +109,39 @@ class UWSettings:
         self.return_stderr: bool = False  # Forward stderr output to the return values
         self.output_splitlines: bool = False  # Split lines of output
         self.output_decode: bool = True  # Decode output to str
-        self.output_parser: str = ""  # Output parser (yaml, json, splitlines, auto)
+        self.output_parser: str = ""  # Parse yaml, json, splitlines, lines, table, auto
         self.warn_stderr: bool = True  # Forward stderr output to warnings
-        self.cwd: str = None  # Current working directory
-        self.env: str = None  # Env for environment variables
+        self.log_stderr: bool = False  # Forward stderr to logging instead of warnings
+        self.log_stderr_interval: float = 60  # Min seconds between logging equal stderr
+        self.max_stderr_bytes: int = 0  # Only keep the last n bytes of stderr, 0 = all
+        self.resolve_executable: bool = False  # Look up executables in PATH only once
+        self.cache_dir: str = None  # Dir for on-disk caches, ~/.cache/universalwrapper
+        self.help_cache: bool = True  # Cache help texts on disk, see help_index
+        self.inputs: List[str] = None  # Skip the call if these and argv are unchanged
+        self.outputs: List[str] = None  # Files created by the call, see inputs
+        self.timeout: float = None  # Seconds after which the call is terminated
+        self.timeout_grace: float = 5  # Seconds between terminating and killing
+        self.executor: str = None  # Run calls in a daemon, e.g. unix:///run/uw.sock
+        self.backend: str = ""  # "record" calls to fixture or "replay" them from it
+        self.fixture: str = None  # Fixture file of the backend, .gz to compress
+        self.fixture_env: List[str] = None  # Env variables that identify a call
+        self.pidfd: bool = False  # Watch async calls with pidfds instead of asyncio
+        self.reactor: bool = False  # Run parallel calls in one thread, see ParallelCall
+        self.max_in_flight: int = 0  # Max concurrent calls per limit_key, 0 = no limit
+        self.rate_limit: float = 0  # Max calls started per second per limit_key
+        self.rate_burst: int = 1  # Calls that may start at once within the rate_limit
+        self.adaptive: bool = False  # Adapt the in-flight limit to latency and failures
+        self.limit_key: str = ""  # Calls with the same key share limits, "" = command
+        self.cwd: str = None  # Current working directory, list to fan out
+        self.env: str = None  # Env for environment variables, list to fan out
+        self.env_overlay: dict = None  # Variables to add to the (inherited) env
         self.parallel: bool = False  # run subprocess in background, but without async
+        self.chunk_args: bool = False  # Split arguments over calls that fit ARG_MAX
+        self.chunk_workers: int = 1  # Number of chunks to run concurrently
+        self.fanout_workers: int = 8  # Max concurrent calls for a list of cwd or env
+        self.result: str = ""  # "lazy" to return a CommandResult, parsed on access
+        self.parse_offload: int = 0  # Parse outputs of >= n bytes in a pool, 0 = off
+        self.parse_pool: str = "thread"  # Pool for offloaded parsing (thread, process)
 
         self._depricated = [
             "output_splitlines",
@@ -108,290 +199,2330 @@ class SubprocessError(subprocess.CalledProcessError):
     more intuitive by including the commands output
     """
 
+    tail_bytes: int = 4096  # Number of bytes of stdout and stderr shown in the message
+
     def __str__(self) -> str:
         """Compiles variables from self to a coherent error message
 
         :returns: Error message
         """
-        msg = f"{super().__str__()[:-1]}:\n"
+        return f"{super().__str__()[:-1]}:\n{self._format_outputs()}"
+
+    def _format_outputs(self) -> str:
+        """Formats the tails of stdout and stderr for the error message
+
+        :returns: stdout and stderr, prefixed with "| "
+        """
+        msg = ""
         for err in ("stdout", "stderr"):
             std = getattr(self, err)
             if std:
-                std = std.decode().strip().replace("\n", "\n| ")
+                dropped = getattr(std, "dropped", 0)
+                omitted = max(len(std) - self.tail_bytes, 0)
+                std = std[omitted:].decode(errors="replace").strip()
+                std = std.replace("\n", "\n| ")
+                if omitted:
+                    std = f"[{omitted} bytes omitted]\n| {std}"
+                if dropped:
+                    std = f"[{dropped} bytes dropped]\n| {std}"
                 msg += f"{err}:\n| {std}\n"
         return msg
 
 
-class UniversalWrapper:
-    """UniversalWrapper is a convenient shell wrapper for python, allowing you to
-    interact with command line interfaces as if they were Python modules.
-    UniversalWrapper has no code specific to any particular command and the use of
-    UniversalWrapper is in no way limited to the commands below.
+class SubprocessTimeoutError(SubprocessError):
+    """Error class for calls that exceeded their timeout. stdout and stderr contain the
+    output of the command up to the moment it was terminated.
+    """
+
+    def __init__(
+        self,
+        cmd: List[str],
+        timeout: float,
+        stdout: ByteString,
+        stderr: ByteString,
+        returncode: int = None,
+    ) -> None:
+        """Stores the partial output of the call
+
+        :param cmd: command that timed out
+        :param timeout: timeout of the call in seconds
+        :param stdout: subprocess output up to the timeout
+        :param stderr: subprocess error output up to the timeout
+        :param returncode: return code of the terminated process, if it was started
+        """
+        super().__init__(returncode, cmd, stdout, stderr)
+        self.timeout = timeout
+
+    def __str__(self) -> str:
+        """Compiles variables from self to a coherent error message
+
+        :returns: Error message
+        """
+        msg = f"Command '{self.cmd}' timed out after {self.timeout} seconds:\n"
+        return msg + self._format_outputs()
+
+
+class SubprocessErrorGroup(SubprocessError):
+    """Error class that bundles the errors of a chunked call. The returncode, cmd and
+    output of the first failed chunk are exposed the same way as for SubprocessError,
+    the others can be found in `errors`.
+    """
+
+    def __init__(self, errors: List[SubprocessError], outputs: list) -> None:
+        """Collects the errors of the failed chunks
+
+        :param errors: Errors of the failed chunks, in order
+        :param outputs: Outputs of all chunks, None for the chunks that failed
+        """
+        first = errors[0]
+        super().__init__(first.returncode, first.cmd, first.stdout, first.stderr)
+        self.errors = errors
+        self.outputs = outputs
+
+    def __str__(self) -> str:
+        """Compiles the error messages of all failed chunks
+
+        :returns: Error message
+        """
+        msg = f"{len(self.errors)} of {len(self.outputs)} chunks failed:\n"
+        return msg + "\n".join(str(error) for error in self.errors)
+
+
+class LineIndex(Sequence):
+    """Read-only sequence of the lines in a shell calls output. Rather than creating a
+    str for every line, the raw output is kept together with an array of the offsets
+    of the lines. Lines are only decoded when they are accessed, which keeps the
+    memory usage close to the size of the output itself.
+
+    Lines are separated by "\\n", a trailing "\\r" is removed from each line.
 
     Example usage:
       ```
       from universalwrapper import git
 
-      git.clone("https://github.com/Basdbruijne/UniversalWrapper.git")
-      diff = git.diff(name_only=True)
+      files = git.ls_files(_output_parser="lines")
+      print(len(files), files[0], files[-10:])
+      python_files = files.grep(r"\\.py$")
       ```
-
-    To adjust the behavior of the wrapper, the uw_settings attribute of the wrapper can
-    be adjusted according to the rules defined under `class UwSettings`.
     """
 
-    def __init__(self, cmd: str, uw_settings: UWSettings = None, **kwargs) -> None:
-        """Loads the default settings and changes the settings if requested
+    def __init__(self, data: ByteString, encoding: str = "utf-8") -> None:
+        """Builds the line offsets of data
 
-        :param cmd: Base command for the class
-        :uw_settings: Pre-configured UWSettings object
-        :kwargs: {key: value} UWSettings to configure
+        :param data: output to index
+        :param encoding: encoding used to decode the lines
         """
-        if uw_settings:
-            self.uw_settings = uw_settings
-        else:
-            self.uw_settings = UWSettings()
-        self.uw_settings.cmd = cmd.replace("_", self.uw_settings.divider)
-        self.uw_settings._reset_command()
-        self._flags_to_remove = []
-
-    @property
-    def __doc__(self):
-        return self(help=True)
+        self._data = bytes(data)
+        self._encoding = encoding
+        self._starts = array("Q", [0])
+        find, append = self._data.find, self._starts.append
+        position = find(b"\n")
+        while position != -1:
+            append(position + 1)
+            position = find(b"\n", position + 1)
+        if self._data and not self._data.endswith(b"\n"):
+            append(len(self._data) + 1)
 
-    def __call__(self, *args: Union[int, str], **kwargs: Union[int, str]) -> str:
-        """Receives the users commands and directs them to the right functions
+    @classmethod
+    def _view(cls, data: bytes, starts: array, encoding: str) -> "LineIndex":
+        """Creates a LineIndex of a range of lines, sharing the data of the original
 
-        :param args: collection of non-keyword arguments for the shell call
-        :param kwargs: collection of keyword arguments for the shell call, can
-        either be `key = value` for `--key value` or `key = True` for `--key`
-        :returns: Response of the shell call
+        :param data: output of the original LineIndex
+        :param starts: offsets of the lines in the range
+        :param encoding: encoding used to decode the lines
+        :returns: LineIndex of the range
         """
-        command = self.uw_settings.cmd.split(" ")
-        self.uw_settings._reset_command()
-        for key in self.uw_settings._incidentals:
-            setattr(self, f"_{key}", getattr(self.uw_settings, key))
-        command.extend(self._generate_command(*args, **kwargs))
-        command = self._input_modifier(command)
-        if self._root:
-            command = ["sudo"] + command
-        cmd = shlex.split(" ".join(command), posix=False)
-        if self._debug:
-            print(f"Generated command:\n{cmd}")
-            return
-        if self._enable_async:
-            return self._async_run_cmd(cmd)
-        elif self._parallel:
-            return self._run_cmd_parallel(cmd)
-        else:
-            return self._run_cmd(cmd)
+        view = cls.__new__(cls)
+        view._data, view._starts, view._encoding = data, starts, encoding
+        return view
 
-    def _generate_command(
-        self, *args: Union[int, str], **kwargs: Union[int, str]
-    ) -> List[str]:
-        """Transforms the args and kwargs to bash arguments and flags
+    def _line(self, index: int) -> str:
+        """Decodes a single line
 
-        :param args: collection of non-keyword arguments for the shell call
-        :param kwargs: collection of keyword arguments for the shell call
-        :returns: Shell call
+        :param index: index of the line, must be in range(0, len(self))
+        :returns: decoded line
         """
-        command = []
-        self._root = False
-        for string in args:
-            if " " in str(string):
-                string = f"'{string}'"
-            command.append(str(string))
-        for key, values in kwargs.items():
-            if key.startswith("_") and key[1:] in self.uw_settings._incidentals:
-                if key[1:] in self.uw_settings._depricated:
-                    self.uw_settings.deprecationwarning(key[1:], stacklevel=4)
-                setattr(self, key, values)
-            else:
-                if type(values) != list:
-                    values = [values]
-                for value in values:
-                    if value is False:
-                        self._flags_to_remove.append(self._add_dashes(key))
-                    else:
-                        command.append(self._add_dashes(key))
-                        command[-1] += f" {value}" * (not value is True)
-        return command
+        line = self._data[self._starts[index] : self._starts[index + 1] - 1]
+        if line.endswith(b"\r"):
+            line = line[:-1]
+        return line.decode(self._encoding)
 
-    def _add_dashes(self, flag: str) -> str:
-        """Adds the right number of dashes for the bash flags based on the
-        convention that single lettered flags get a single dash and multi-
-        lettered flags get a double dash
+    def __len__(self) -> int:
+        return len(self._starts) - 1
 
-        :param flag: flag to add dashes to
-        :returns: flag with dashes
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, "LineIndex"]:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self._line(i) for i in range(start, stop, step)]
+            stop = max(start, stop)
+            return self._view(
+                self._data, self._starts[start : stop + 1], self._encoding
+            )
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("LineIndex index out of range")
+        return self._line(index)
+
+    def __iter__(self) -> Iterator[str]:
+        for index in range(len(self)):
+            yield self._line(index)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Sequence) and not isinstance(other, str):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"LineIndex(<{len(self)} lines>)"
+
+    def grep(self, pattern: Union[str, ByteString, re.Pattern]) -> List[str]:
+        """Returns the lines that contain a match for a regular expression. The search
+        runs over the raw output at once, only the matching lines are decoded.
+
+        :param pattern: regular expression, "^" and "$" match at the line boundaries,
+        "$" also matches before the "\\r" of a "\\r\\n" line ending
+        :returns: matching lines
         """
-        if len(str(flag)) > 1 and self._double_dash:
-            return f"--{flag.replace('_', self.uw_settings.flag_divider)}"
-        else:
-            return f"-{flag}"
+        if isinstance(pattern, re.Pattern):
+            pattern = pattern.pattern
+        if isinstance(pattern, str):
+            pattern = pattern.encode(self._encoding)
+        regex = re.compile(_crlf_anchors(pattern), re.MULTILINE)
+        lines, last = [], -1
+        end = min(self._starts[-1], len(self._data))
+        for match in regex.finditer(self._data, self._starts[0], end):
+            index = bisect.bisect_right(self._starts, match.start()) - 1
+            if index != last and index < len(self):
+                lines.append(self._line(index))
+                last = index
+        return lines
 
-    def _input_modifier(self, command: List[str]) -> List[str]:
-        """Handles the input modifiers, e.g. adding and moving commands
+    def startswith(self, prefix: Union[str, ByteString]) -> List[str]:
+        """Returns the lines that start with prefix
 
-        :param command: List of initial commands
-        :returns: Modified list of commands based on uw_settings input
-        modifiers
+        :param prefix: prefix to look for
+        :returns: matching lines
         """
-        for input_command, index in self.uw_settings.input_add.items():
-            if not input_command.split(" ")[0] in self._flags_to_remove:
-                command = self._insert_command(command, input_command, index)
-        self._flags_to_remove = []
-        for move_command, index in self.uw_settings.input_move.items():
-            cmd = [cmd.split(" ")[0] for cmd in command]
-            if move_command in cmd:
-                command_index = cmd.index(move_command)
-                popped_command = command.pop(command_index)
-                command = self._insert_command(command, popped_command, index)
-        for cmd in self.uw_settings.input_custom:
-            exec(cmd)
-        return command
+        if isinstance(prefix, str):
+            prefix = prefix.encode(self._encoding)
+        return self.grep(b"^" + re.escape(prefix))
 
-    def _insert_command(
-        self, command: List[str], input_command: str, index: int
-    ) -> List[str]:
-        """Combines list.append and list.inset to a continues insert function
 
-        :param command: Initial command to add items to
-        :param input_command: Item to add to command
-        :param index: Index to add command, must be in range(0, len(command))
-        or -1
-        :returns: Modified command
+class CommandResult:
+    """Result of a shell call that keeps the raw output and only decodes or parses it
+    when it is accessed. The decoded and parsed forms are cached, so callers that do
+    not use the output do not pay for decoding or parsing it.
+
+    Example usage:
+      ```
+      from universalwrapper import kubectl
+
+      pods = kubectl.get.pods(output="json", _result="lazy")
+      print(pods.duration, len(pods.stdout))
+      names = [pod["metadata"]["name"] for pod in pods.json["items"]]
+      ```
+    """
+
+    def __init__(
+        self,
+        cmd: List[str],
+        returncode: int,
+        stdout: ByteString,
+        stderr: ByteString,
+        duration: float = None,
+    ) -> None:
+        """Stores the raw output of the shell call
+
+        :param cmd: command that was run
+        :param returncode: return code of the process
+        :param stdout: subprocess output
+        :param stderr: subprocess error output
+        :param duration: time in seconds between starting and finishing the call
         """
-        if index == -1:
-            command.append(input_command)
-            return command
-        elif index < 0:
-            index += 1
-        command.insert(index, input_command)
-        return command
+        self.cmd = cmd
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.duration = duration
+        self._cache = {}
 
-    def _run_cmd(self, cmd: List[str]) -> str:
-        """Forwards the generated command to subprocess
+    def _cached(self, key: str, parse: callable) -> object:
+        """Returns the cached value of key, or computes it with parse
 
-        :param: List of string which combined make the shell command
-        :returns: Output of shell command
+        :param key: name of the cached value
+        :param parse: function to compute the value with
+        :returns: cached value
         """
-        proc = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            cwd=self._cwd,
-            env=self._env,
+        if key not in self._cache:
+            self._cache[key] = parse()
+        return self._cache[key]
+
+    @property
+    def text(self) -> str:
+        """stdout decoded to str"""
+        return self._cached("text", lambda: self.stdout.decode())
+
+    @property
+    def lines(self) -> "LineIndex":
+        """stdout split in lines"""
+        return self._cached("lines", lambda: LineIndex(self.stdout))
+
+    @property
+    def json(self) -> Union[dict, list]:
+        """stdout parsed as json"""
+        return self._cached("json", lambda: json.loads(self.stdout))
+
+    @property
+    def yaml(self) -> Union[dict, list]:
+        """stdout parsed as yaml"""
+        return self._cached("yaml", lambda: yaml.safe_load(self.stdout))
+
+    def __bool__(self) -> bool:
+        return self.returncode == 0
+
+    def __str__(self) -> str:
+        return self.text
+
+    def __repr__(self) -> str:
+        return (
+            f"CommandResult(cmd={self.cmd!r}, returncode={self.returncode}, "
+            f"stdout=<{len(self.stdout)} bytes>, stderr=<{len(self.stderr)} bytes>)"
         )
-        stdout, stderr = proc.communicate()
-        return self._raise_or_return(stdout, stderr, proc.returncode, cmd)
 
-    @autothread.async_threaded()
-    def _run_cmd_parallel(self, cmd: List[str]) -> Union[str, dict, list]:
-        """Forwards the generated command to subprocess
 
-        :param: List of string which combined make the shell command
-        :returns: Output of shell command
+class HelpIndex:
+    """Subcommands and flags parsed from the help text of a command. The parsing is
+    based on common conventions for help texts, so it gives an indication rather than
+    an exact list.
+
+    Example usage:
+      ```
+      import universalwrapper as uw
+
+      index = uw.help_index(uw.git.remote)
+      "rename" in index  # True
+      index.complete("--v")  # ["--verbose"]
+      ```
+    """
+
+    def __init__(
+        self,
+        text: str,
+        command: str = "",
+        subcommands: List[str] = None,
+        flags: List[str] = None,
+    ) -> None:
+        """Parses the help text, unless the subcommands and flags are already given
+
+        :param text: help text of the command
+        :param command: the command itself, e.g. "git remote", used to find the
+        subcommands in usage lines like "usage: git remote rename <old> <new>"
+        :param subcommands: subcommands in the help text
+        :param flags: flags in the help text
         """
-        proc = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            cwd=self._cwd,
-            env=self._env,
-        )
-        stdout, stderr = proc.communicate()
-        return self._raise_or_return(stdout, stderr, proc.returncode, cmd)
+        self.text = text
+        self.command = command
+        if subcommands is None:
+            subcommands = re.findall(
+                r"^\s{2,}([a-z][a-z0-9_-]*)(?=,?\s{2,}\S|\s*$)", text, re.MULTILINE
+            )
+            if command:
+                pattern = rf"^\s*(?:usage|or):\s+{re.escape(command)}\s+([a-z][\w-]*)"
+                subcommands += re.findall(pattern, text, re.I | re.M)
+        if flags is None:
+            flags = re.findall(r"(?:^|(?<=[\s\[,|]))(--?[A-Za-z0-9][\w-]*)", text)
+        self.subcommands = sorted(set(subcommands))
+        self.flags = sorted(set(flags))
 
-    async def _async_run_cmd(self, cmd: List[str]) -> str:
-        """Forwards the generated command to async subprocess
+    def __contains__(self, name: str) -> bool:
+        return name in self.subcommands or name in self.flags
 
-        :param: List of string which combined make the shell command
-        :returns: Output of shell command
+    def complete(self, prefix: str) -> List[str]:
+        """Returns the subcommands or flags that start with prefix
+
+        :param prefix: start of a subcommand or flag
+        :returns: matching subcommands and flags
         """
-        proc = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            cwd=self._cwd,
-            env=self._env,
-        )
+        options = self.flags if prefix.startswith("-") else self.subcommands
+        return [option for option in options if option.startswith(prefix)]
+
 
-        async def _output(proc):
-            stdout, stderr = await proc.communicate()
-            return self._raise_or_return(stdout, stderr, proc.returncode, cmd)
+class _RunCache:
+    """Persistent store of successful runs, used to skip commands of which the inputs
+    did not change. The runs are stored in a sqlite database in the cache directory,
+    so they are shared between processes.
+    """
 
-        return _output(proc)
+    def __init__(self, cache_dir: str = None) -> None:
+        """Opens the store, creating it if needed
 
-    def _raise_or_return(
-        self, stdout: ByteString, stderr: ByteString, return_code: int, cmd: List[str]
-    ) -> str:
-        """Handles the error displaying for the subprocesses
+        :param cache_dir: configured cache_dir, if any
+        """
+        os.makedirs(_cache_dir(cache_dir), exist_ok=True)
+        self.path = os.path.join(_cache_dir(cache_dir), "incremental.sqlite")
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS runs (key TEXT PRIMARY KEY, inputs TEXT, "
+                "outputs TEXT, stdout BLOB, stderr BLOB)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key: str) -> tuple:
+        """Returns the stored run
 
+        :param key: key of the run
+        :returns: (inputs, outputs, stdout, stderr) or None
+        """
+        with closing(self._connect()) as db:
+            return db.execute(
+                "SELECT inputs, outputs, stdout, stderr FROM runs WHERE key = ?", (key,)
+            ).fetchone()
+
+    def put(
+        self,
+        key: str,
+        inputs: str,
+        outputs: str,
+        stdout: ByteString,
+        stderr: ByteString,
+    ) -> None:
+        """Stores a run, replacing the previous run with the same key
+
+        :param key: key of the run
+        :param inputs: digest of the inputs
+        :param outputs: digest of the outputs
         :param stdout: subprocess output
         :param stderr: subprocess error output
-        :param return_code: return code of the process
-        :param cmd: original command, used for error message
-        :returns: Output of shell command
         """
-        if return_code == 0:
-            if stderr and self._warn_stderr:
-                warnings.warn("\n" + stderr.decode(), UserWarning, stacklevel=4)
-            if self._return_stderr:
-                stdout = stderr + b"\n" + stdout
-            if self._output_parser:
-                return self._parse_output(stdout)
-            else:
-                return self._output_modifier(stdout)
-        raise SubprocessError(return_code, cmd, stdout, stderr)
-
-    def _parse_output(self, output: str):
-        output = output.decode()
-        options = ["yaml", "json", "splitlines", "auto"]
-        if not self._output_parser in options:
-            raise ValueError(
-                f"{self._output_parser} is not a valid parser, choose from {options}"
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?)",
+                (key, inputs, outputs, bytes(stdout), bytes(stderr)),
             )
 
-        if self._output_parser == "yaml":
-            return yaml.safe_load(output)
-        elif self._output_parser == "json":
-            return json.loads(output)
-        elif self._output_parser == "splitlines":
-            return output.splitlines()
-        elif self._output_parser == "auto":
-            try:
-                return json.loads(output)
-            except json.decoder.JSONDecodeError:
-                pass
-            try:
-                parsed = yaml.safe_load(output)
-                if isinstance(parsed, list) or isinstance(parsed, dict):
-                    return parsed
-            except yaml.YAMLError:
+
+class _Fixture:
+    """Recorded calls for the record and replay backends. Every call is stored as a
+    json line with argv, cwd, the identifying env variables, stdout, stderr, return
+    code and duration. Outputs are stored as text, bytes that are not valid utf-8 are
+    escaped. A call that was recorded multiple times is replayed in the same order,
+    after which the last recording is repeated.
+    """
+
+    def __init__(self, path: str, backend: str) -> None:
+        """Opens the fixture, recording starts with an empty fixture
+
+        :param path: path of the fixture, gzip compressed if it ends with .gz
+        :param backend: "record" or "replay"
+        """
+        self.path = path
+        self._open = gzip.open if path.endswith(".gz") else open
+        self._lock = Lock()
+        self._calls = {}  # {key: [recorded call]}
+        self._replayed = {}  # {key: number of times it was replayed}
+        if backend == "record":
+            with self._open(path, "wt", encoding="utf-8"):
                 pass
-            return output
+            return
+        with self._open(path, "rt", encoding="utf-8") as file:
+            for line in file:
+                call = json.loads(line)
+                key = _fixture_key(call["cmd"], call["cwd"], call["env"])
+                self._calls.setdefault(key, []).append(call)
 
-    def _output_modifier(self, output: str) -> str:
-        """Modifies the subprocess' output according to uw_settings
+    def record(
+        self,
+        cmd: List[str],
+        cwd: str,
+        env: dict,
+        stdout: ByteString,
+        stderr: ByteString,
+        returncode: int,
+        duration: float,
+    ) -> None:
+        """Appends a call to the fixture
 
-        :param output: string to modify, e.g. parse
-        :returns: modified output
+        :param cmd: List of string which combined make the shell command
+        :param cwd: configured working directory of the call
+        :param env: identifying env variables of the call
+        :param stdout: subprocess output
+        :param stderr: subprocess error output
+        :param returncode: return code of the call
+        :param duration: duration of the call in seconds
         """
-        if self._output_decode:
-            output = output.decode()
-        if self._output_yaml:
-            output = yaml.safe_load(output)
-        if self._output_json:
-            output = json.loads(output)
-        if self._output_splitlines:
-            output = output.splitlines()
-        for cmd in self.uw_settings.output_custom:
-            exec(cmd)
-        return output
+        call = {
+            "cmd": cmd,
+            "cwd": cwd,
+            "env": env,
+            "stdout": bytes(stdout).decode("utf-8", "surrogateescape"),
+            "stderr": bytes(stderr).decode("utf-8", "surrogateescape"),
+            "returncode": returncode,
+            "duration": round(duration, 6),
+        }
+        line = json.dumps(call, separators=(",", ":")) + "\n"
+        with self._lock, self._open(self.path, "at", encoding="utf-8") as file:
+            file.write(line)
 
-    def __getattr__(self, attr):
-        """Handles the creation of (sub)classes"""
+    def replay(self, cmd: List[str], cwd: str, env: dict) -> tuple:
+        """Returns the recorded output of a call
+
+        :param cmd: List of string which combined make the shell command
+        :param cwd: configured working directory of the call
+        :param env: identifying env variables of the call
+        :returns: stdout, stderr, return code and duration of the call
+        """
+        key = _fixture_key(cmd, cwd, env)
+        if key not in self._calls:
+            raise LookupError(f"Call {cmd} in {cwd} was not recorded in {self.path}")
+        with self._lock:
+            calls = self._calls[key]
+            index = min(self._replayed.get(key, 0), len(calls) - 1)
+            self._replayed[key] = index + 1
+        call = calls[index]
+        return (
+            call["stdout"].encode("utf-8", "surrogateescape"),
+            call["stderr"].encode("utf-8", "surrogateescape"),
+            call["returncode"],
+            call["duration"],
+        )
+
+
+class _PidfdProcess:
+    """Async wrapper of a subprocess.Popen with the interface of
+    asyncio.subprocess.Process that is used by UniversalWrapper. The exit of the
+    process is detected by registering its pidfd in the event loop, and its pipes are
+    read by the event loop as well, so no child watcher, SIGCHLD handler or thread is
+    involved. Linux only, see _pidfd_supported.
+    """
+
+    def __init__(self, popen: subprocess.Popen) -> None:
+        """Registers the pidfd and pipes of the process in the running event loop
+
+        :param popen: process started with stdout and stderr pipes
+        """
+        self._popen = popen
+        self._loop = asyncio.get_running_loop()
+        self._exited = self._loop.create_future()
+        self.pid = popen.pid
+        self.stdout = asyncio.StreamReader()
+        self.stderr = asyncio.StreamReader()
+        self._pidfd = os.pidfd_open(popen.pid)
+        self._loop.add_reader(self._pidfd, self._reap)
+        for pipe, reader in ((popen.stdout, self.stdout), (popen.stderr, self.stderr)):
+            os.set_blocking(pipe.fileno(), False)
+            self._loop.add_reader(pipe.fileno(), self._read, pipe, reader)
+
+    @property
+    def returncode(self) -> int:
+        return self._popen.returncode
+
+    def _read(self, pipe, reader: asyncio.StreamReader) -> None:
+        """Forwards the available output of a pipe to its reader
+
+        :param pipe: stdout or stderr pipe of the process
+        :param reader: stream to feed
+        """
+        try:
+            data = os.read(pipe.fileno(), 65536)
+        except BlockingIOError:
+            return
+        if data:
+            reader.feed_data(data)
+            return
+        self._loop.remove_reader(pipe.fileno())
+        pipe.close()
+        reader.feed_eof()
+
+    def _reap(self) -> None:
+        """Collects the exit status once the pidfd is readable"""
+        self._loop.remove_reader(self._pidfd)
+        os.close(self._pidfd)
+        self._popen.wait()  # the process exited, so this does not block
+        self._exited.set_result(self._popen.returncode)
+
+    async def wait(self) -> int:
+        """Waits for the process to exit
+
+        :returns: return code
+        """
+        return await asyncio.shield(self._exited)
+
+    async def communicate(self) -> tuple:
+        """Reads the output until the process exits
+
+        :returns: stdout, stderr
+        """
+        stdout, stderr, _ = await asyncio.gather(
+            self.stdout.read(), self.stderr.read(), self.wait()
+        )
+        return stdout, stderr
+
+    def send_signal(self, sig: int) -> None:
+        self._popen.send_signal(sig)
+
+
+class ParallelCall(Future):
+    """Future of a call with parallel and reactor set. Like the placeholder of a
+    threaded parallel call, it can be used as the output of the call itself, which
+    waits for the call to finish. The methods of concurrent.futures.Future, such as
+    result, done and add_done_callback, are available as well, so it works with
+    concurrent.futures.wait and as_completed. Cancelling the future terminates the
+    process of the call.
+
+    The reactor only collects the raw output, it is decoded and parsed by the first
+    thread that asks for the result, so that parsing a large output does not hold up
+    the other calls.
+    """
+
+    def __init__(self, wrapper: "UniversalWrapper" = None, cmd: List[str] = None):
+        """Creates the future of a call
+
+        :param wrapper: copy of the wrapper with the settings of the call
+        :param cmd: List of string which combined make the shell command
+        """
+        super().__init__()
+        self._wrapper = wrapper
+        self._cmd = cmd
+        self._output_lock = Lock()
+        self._output = None  # (output, exception) once the raw output is processed
+
+    def result(self, timeout: float = None) -> object:
+        """Waits for the call to finish and returns its output, see Future.result
+
+        :param timeout: maximum number of seconds to wait, None to wait forever
+        :returns: Output of shell command
+        """
+        stdout, stderr, returncode, duration = super().result(timeout)
+        with self._output_lock:
+            if self._output is None:
+                try:
+                    output = self._wrapper._raise_or_return(
+                        stdout, stderr, returncode, self._cmd, duration
+                    )
+                    self._output = (output, None)
+                except Exception as error:
+                    self._output = (None, error)
+        output, error = self._output
+        if error is not None:
+            raise error
+        return output
+
+    def exception(self, timeout: float = None) -> Exception:
+        """Waits for the call to finish and returns its exception, see
+        Future.exception
+
+        :param timeout: maximum number of seconds to wait, None to wait forever
+        :returns: the exception of the call, None if it succeeded
+        """
+        error = super().exception(timeout)
+        if error is None:
+            try:
+                self.result()
+            except Exception as output_error:
+                return output_error
+        return error
+
+    def __getattr__(self, attr: str) -> object:
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.result(), attr)
+
+    def __repr__(self) -> str:
+        if self.cancelled():
+            return "<ParallelCall cancelled>"
+        if not self.done():
+            return "<ParallelCall pending>"
+        if self.exception() is not None:
+            return f"<ParallelCall failed with {type(self.exception()).__name__}>"
+        return repr(self.result())
+
+    __hash__ = Future.__hash__
+
+
+def _forward(name: str):
+    """Returns a method that forwards a dunder to the output of a ParallelCall
+
+    :param name: name of the dunder
+    :returns: the method
+    """
+
+    def forward(self, *args):
+        return getattr(self.result(), name)(*args)
+
+    forward.__name__ = name
+    return forward
+
+
+for _name in (
+    "__eq__",
+    "__ne__",
+    "__lt__",
+    "__le__",
+    "__gt__",
+    "__ge__",
+    "__str__",
+    "__format__",
+    "__bool__",
+    "__len__",
+    "__iter__",
+    "__getitem__",
+    "__contains__",
+    "__add__",
+    "__radd__",
+    "__int__",
+    "__float__",
+):
+    setattr(ParallelCall, _name, _forward(_name))
+del _name
+
+
+class _ReactorCall:
+    """State of a call that runs in the reactor"""
+
+    def __init__(
+        self,
+        wrapper: "UniversalWrapper",
+        cmd: List[str],
+        kwargs: dict,
+        future: ParallelCall,
+        limiter: "_Limiter" = None,
+    ) -> None:
+        """Collects the state of a call
+
+        :param wrapper: copy of the wrapper with the settings of the call
+        :param cmd: List of string which combined make the shell command
+        :param kwargs: Keyword arguments for subprocess, see _popen_kwargs
+        :param future: future to resolve when the call finished
+        :param limiter: limiter that has to admit the call, if any
+        """
+        self.wrapper = wrapper
+        self.cmd = cmd
+        self.kwargs = kwargs
+        self.proc = None  # set once the process is started
+        self.future = future
+        self.limiter = limiter
+        self.admitted = None  # time.monotonic() at which the limiter admitted the call
+        self.start = time.monotonic()
+        self.stdout = io.BytesIO()
+        self.stderr = (
+            _TailBuffer(wrapper._max_stderr_bytes)
+            if wrapper._max_stderr_bytes
+            else io.BytesIO()
+        )
+        self.open_pipes = 2
+        self.pidfd = None
+        self.deadline = wrapper._deadline
+        self.kill_at = None  # time to send SIGKILL after a timeout
+        self.timed_out = False
+        self.cancelled = False
+
+
+class _Reactor:
+    """Single thread that runs all parallel calls with reactor set. The pipes of all
+    calls are multiplexed with selectors and finished processes are reaped through
+    their pidfd on Linux, or by polling them otherwise. Calls are handed over by the
+    calling thread, which also starts the process, see UniversalWrapper._submit.
+    Calls with limits are queued instead and started by the reactor once their
+    limiter admits them. A call that the reactor fails to handle is killed, the
+    other calls continue.
+    """
+
+    def __init__(self) -> None:
+        """Starts the reactor thread"""
+        self._selector = selectors.DefaultSelector()
+        self._wakeup, self._waker = os.pipe()
+        os.set_blocking(self._wakeup, False)
+        os.set_blocking(self._waker, False)
+        self._selector.register(self._wakeup, selectors.EVENT_READ)
+        self._lock = Lock()
+        self._submitted = []
+        self._calls = set()
+        self._reaping = set()  # calls of which the pipes closed, without pidfd
+        self._queued = []  # calls waiting to be admitted, in order of submission
+        self._next_admit = float("inf")  # time at which a queued call may start
+        Thread(target=self._loop, name="uw-reactor", daemon=True).start()
+
+    def submit(self, call: _ReactorCall) -> None:
+        """Hands a started call, or a call that waits for its limiter, over to the
+        reactor thread
+
+        :param call: the call
+        """
+        with self._lock:
+            self._submitted.append(call)
+        call.future.add_done_callback(self._cancelled)
+        self._wake()
+
+    def _wake(self) -> None:
+        """Wakes up the reactor thread"""
+        try:
+            os.write(self._waker, b"\0")
+        except BlockingIOError:  # the reactor is woken up already
+            pass
+
+    def _cancelled(self, future: ParallelCall) -> None:
+        """Wakes up the reactor to terminate the process of a cancelled call
+
+        :param future: future of a call that is done or cancelled
+        """
+        if future.cancelled():
+            self._wake()
+
+    def _loop(self) -> None:
+        """Runs forever, the thread is a daemon"""
+        while True:
+            woken = False
+            for key, _ in self._selector.select(self._timeout()):
+                if key.fd == self._wakeup:
+                    self._register()
+                    woken = True
+                else:
+                    call, callback = key.data
+                    self._guard(call, callback)
+            now = time.monotonic()
+            if self._queued and (woken or now >= self._next_admit):
+                self._admit(now)
+            for call in list(self._calls):
+                self._guard(call, lambda call=call: self._expire(call, now))
+            for call in list(self._reaping):
+                if call.proc.poll() is not None:
+                    self._reaping.discard(call)
+                    self._guard(call, lambda call=call: self._finish(call))
+
+    def _guard(self, call: _ReactorCall, callback) -> None:
+        """Runs a step of a call, a failing step kills the call instead of stopping
+        the reactor thread
+
+        :param call: the call
+        :param callback: the step, called without arguments
+        """
+        try:
+            callback()
+        except Exception as error:
+            logger.exception(f"Reactor failed to handle {call.cmd}")
+            self._abort(call, error)
+
+    def _expire(self, call: _ReactorCall, now: float) -> None:
+        """Terminates a call that timed out or was cancelled, and kills it if it does
+        not exit within timeout_grace
+
+        :param call: the call
+        :param now: time.monotonic()
+        """
+        if not call.cancelled and call.future.cancelled():
+            call.cancelled = True
+            call.deadline = now
+        if call.deadline is not None and now >= call.deadline:
+            call.deadline = None
+            call.timed_out = not call.cancelled
+            call.kill_at = now + call.wrapper._timeout_grace
+            _signal(call.proc, signal.SIGTERM, True)
+        elif call.kill_at is not None and now >= call.kill_at:
+            call.kill_at = None
+            _signal(call.proc, _SIGKILL, True)
+
+    def _abort(self, call: _ReactorCall, error: Exception) -> None:
+        """Kills a call that the reactor failed to handle and fails its future
+
+        :param call: the call
+        :param error: the error that the reactor ran into
+        """
+        if call.proc is not None:
+            for fileobj in (call.proc.stdout, call.proc.stderr, call.pidfd):
+                try:
+                    self._selector.unregister(fileobj)
+                except (KeyError, ValueError):  # closed or not registered
+                    pass
+            call.proc.stdout.close()
+            call.proc.stderr.close()
+            _signal(call.proc, _SIGKILL, True)
+        if call.pidfd is not None:
+            os.close(call.pidfd)
+            call.pidfd = None
+        self._calls.discard(call)
+        self._reaping.discard(call)
+        self._release(call, True)
+        self._resolve(call, error=error)
+
+    def _release(self, call: _ReactorCall, failed: bool) -> None:
+        """Releases the limiter of a call, if it admitted the call
+
+        :param call: the call
+        :param failed: see _Limiter.release
+        """
+        if call.admitted is not None:
+            call.limiter.release(call.admitted, failed)
+            call.admitted = None
+
+    def _resolve(
+        self, call: _ReactorCall, output: object = None, error: Exception = None
+    ) -> None:
+        """Resolves the future of a call, unless it was cancelled or resolved already
+
+        :param call: the call
+        :param output: stdout, stderr, return code and duration of the call
+        :param error: the exception of the call, if it failed
+        """
+        if call.future.done():
+            return
+        try:
+            if error is None:
+                call.future.set_result(output)
+            else:
+                call.future.set_exception(error)
+        except _INVALID_STATE:  # cancelled in the meantime
+            pass
+
+    def _timeout(self) -> float:
+        """Returns the time until the next deadline or kill, for select
+
+        :returns: seconds, or None to wait until a pipe is ready
+        """
+        if self._reaping:
+            return 0.005
+        times = [call.deadline for call in self._calls if call.deadline is not None]
+        times += [call.kill_at for call in self._calls if call.kill_at is not None]
+        if self._queued:
+            times.append(self._next_admit)
+        if not times or min(times) == float("inf"):
+            return None
+        return max(min(times) - time.monotonic(), 0)
+
+    def _register(self) -> None:
+        """Registers the pipes of the submitted calls"""
+        try:
+            while os.read(self._wakeup, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        with self._lock:
+            submitted, self._submitted = self._submitted, []
+        for call in submitted:
+            if call.proc is None:
+                self._queued.append(call)
+                continue
+            self._calls.add(call)
+            self._guard(call, lambda call=call: self._watch(call))
+
+    def _admit(self, now: float) -> None:
+        """Starts the queued calls that their limiter admits, in order of submission.
+        Once a call has to wait, the later calls with the same limiter wait as well.
+
+        :param now: time.monotonic()
+        """
+        queued, self._queued = self._queued, []
+        self._next_admit = float("inf")
+        waiting = set()  # limiters that did not admit a call
+        for call in queued:
+            if call.future.cancelled():
+                continue
+            if call.deadline is not None and now >= call.deadline:
+                timeout = call.wrapper._timeout
+                error = SubprocessTimeoutError(call.cmd, timeout, b"", b"")
+                self._resolve(call, error=error)
+                continue
+            wait = None
+            if call.limiter not in waiting:
+                wait = call.limiter.try_acquire(now, self._wake)
+            if wait == 0:
+                call.admitted = now
+                self._guard(call, lambda call=call: self._start(call))
+                continue
+            waiting.add(call.limiter)
+            self._queued.append(call)
+            if call.deadline is not None:
+                self._next_admit = min(self._next_admit, call.deadline)
+            if wait is not None:  # the next token of the rate limit
+                self._next_admit = min(self._next_admit, now + wait)
+
+    def _start(self, call: _ReactorCall) -> None:
+        """Starts the process of an admitted call and registers its pipes
+
+        :param call: the call
+        """
+        try:
+            call.proc = call.wrapper._start(call.cmd, call.kwargs)
+        except OSError as error:
+            self._release(call, True)
+            self._resolve(call, error=error)
+            return
+        call.start = time.monotonic()
+        self._calls.add(call)
+        self._watch(call)
+
+    def _watch(self, call: _ReactorCall) -> None:
+        """Registers the pipes of a call
+
+        :param call: the call
+        """
+        for pipe, buffer in (
+            (call.proc.stdout, call.stdout),
+            (call.proc.stderr, call.stderr),
+        ):
+            os.set_blocking(pipe.fileno(), False)
+            self._selector.register(
+                pipe,
+                selectors.EVENT_READ,
+                (call, lambda pipe=pipe, buffer=buffer: self._read(call, pipe, buffer)),
+            )
+
+    def _read(self, call: _ReactorCall, pipe, buffer) -> None:
+        """Reads the available output of a pipe
+
+        :param call: call the pipe belongs to
+        :param pipe: stdout or stderr pipe of the process
+        :param buffer: buffer to write the output to
+        """
+        try:
+            data = os.read(pipe.fileno(), 65536)
+        except BlockingIOError:
+            return
+        if data:
+            buffer.write(data)
+            return
+        self._selector.unregister(pipe)
+        pipe.close()
+        call.open_pipes -= 1
+        if call.open_pipes:
+            return
+        if call.proc.poll() is not None:
+            self._finish(call)
+        elif _pidfd_supported():
+            call.pidfd = os.pidfd_open(call.proc.pid)
+            self._selector.register(
+                call.pidfd, selectors.EVENT_READ, (call, lambda: self._reap(call))
+            )
+        else:
+            self._reaping.add(call)
+
+    def _reap(self, call: _ReactorCall) -> None:
+        """Collects the exit status once the pidfd of the process is readable
+
+        :param call: the exited call
+        """
+        self._selector.unregister(call.pidfd)
+        os.close(call.pidfd)
+        call.pidfd = None
+        call.proc.wait()
+        self._finish(call)
+
+    def _finish(self, call: _ReactorCall) -> None:
+        """Resolves the future of a finished call with its raw output, which is
+        processed by ParallelCall.result
+
+        :param call: the finished call
+        """
+        self._calls.discard(call)
+        wrapper, proc = call.wrapper, call.proc
+        cancelled = call.future.cancelled()
+        self._release(
+            call, None if cancelled else call.timed_out or proc.returncode != 0
+        )
+        if cancelled:
+            return
+        stdout, stderr = call.stdout.getvalue(), call.stderr.getvalue()
+        if call.timed_out:
+            error = SubprocessTimeoutError(
+                call.cmd, wrapper._timeout, stdout, stderr, proc.returncode
+            )
+            self._resolve(call, error=error)
+            return
+        duration = time.monotonic() - call.start
+        self._resolve(call, (stdout, stderr, proc.returncode, duration))
+
+
+class _Limiter:
+    """Admission control for the calls that share a limit_key. At most max_in_flight
+    calls run at the same time and calls start at most rate times per second, with
+    bursts of up to burst calls (token bucket).
+
+    In adaptive mode, the in-flight limit is a window that is adjusted the way TCP
+    congestion control does (AIMD): it starts at one call and grows by one call per
+    successful call until the first congestion, after which it grows by one call per
+    window of successful calls. It is halved when a call fails or takes more than
+    _AIMD_LATENCY times the baseline latency. The window is halved at most once per
+    window of calls, calls that were started before the last decrease do not
+    decrease it again. The baseline is the lowest latency of a successful call,
+    which drifts up slowly so that a single fast call does not keep the window
+    small. max_in_flight caps the window.
+
+    Threads wait on a condition, event loops on an asyncio.Event per loop and the
+    reactor through a callback, all of them are woken up when a call finishes or
+    the limits change.
+    """
+
+    _AIMD_LATENCY = 2.0  # Latency, relative to the baseline, that counts as congestion
+    _AIMD_DRIFT = 1.01  # Factor by which the baseline latency rises on every call
+
+    def __init__(self) -> None:
+        """Creates a limiter without limits, see configure"""
+        self._condition = Condition()
+        self.max_in_flight = 0
+        self.rate = 0
+        self.burst = 1
+        self.adaptive = False
+        self.in_flight = 0
+        self.tokens = float("inf")  # the bucket starts full, see configure
+        self.refilled = time.monotonic()
+        self.window = 1.0
+        self.baseline = None  # baseline latency in seconds
+        self.decreased = float("-inf")  # time of the last decrease of the window
+        self._events = {}  # {event loop: asyncio.Event of the waiting coroutines}
+        self._waiters = set()  # callbacks of the other waiters
+
+    def configure(
+        self, max_in_flight: int, rate: float, burst: int, adaptive: bool
+    ) -> None:
+        """Updates the limits
+
+        :param max_in_flight: maximum number of concurrent calls, 0 = no limit
+        :param rate: maximum number of calls started per second, 0 = no limit
+        :param burst: number of calls that may start at once
+        :param adaptive: adapt the in-flight limit to latency and failures
+        """
+        with self._condition:
+            if (max_in_flight, rate, burst, adaptive) == (
+                self.max_in_flight,
+                self.rate,
+                self.burst,
+                self.adaptive,
+            ):
+                return
+            now = time.monotonic()
+            if self.rate:  # the tokens earned at the old rate
+                elapsed = now - self.refilled
+                self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            # calls with other limits on the same limit_key must not refill the bucket
+            self.tokens = min(self.tokens, max(burst, 1))
+            self.refilled = now
+            self.max_in_flight = max_in_flight
+            self.rate = rate
+            self.burst = max(burst, 1)
+            self.adaptive = adaptive
+            if max_in_flight:
+                self.window = min(self.window, max_in_flight)
+            self._notify()
+
+    @property
+    def limit(self) -> int:
+        """Current in-flight limit, 0 = no limit"""
+        if self.adaptive:
+            return int(self.window)
+        return self.max_in_flight
+
+    def _wait(self, now: float) -> float:
+        """Returns how long a call needs to wait before it can start
+
+        :param now: time.monotonic()
+        :returns: 0 if the call can start, seconds until the next token, or None if
+        the call needs to wait for another call to finish
+        """
+        if self.limit and self.in_flight >= self.limit:
+            return None
+        if self.rate:
+            elapsed = now - self.refilled
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self.refilled = now
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+            self.tokens -= 1
+        self.in_flight += 1
+        return 0
+
+    def acquire(self, timeout: float = None) -> float:
+        """Waits until a call can start
+
+        :param timeout: maximum number of seconds to wait, None to wait forever
+        :returns: time.monotonic() at which the call was admitted
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                wait = self._wait(now)
+                if wait == 0:
+                    return now
+                if deadline is not None:
+                    if now >= deadline:
+                        raise TimeoutError()
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                self._condition.wait(wait)
+
+    async def async_acquire(self, timeout: float = None) -> float:
+        """Waits until a call can start, without blocking the event loop
+
+        :param timeout: maximum number of seconds to wait, None to wait forever
+        :returns: time.monotonic() at which the call was admitted
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        loop = asyncio.get_running_loop()
+        while True:
+            now = time.monotonic()
+            event = None
+            with self._condition:
+                wait = self._wait(now)
+                if wait is None:  # wait for another call to finish
+                    event = self._events.setdefault(loop, asyncio.Event())
+            if wait == 0:
+                return now
+            if deadline is not None:
+                if now >= deadline:
+                    raise TimeoutError()
+                wait = deadline - now if wait is None else min(wait, deadline - now)
+            if event is None:
+                await asyncio.sleep(wait)
+                continue
+            try:
+                await asyncio.wait_for(event.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def try_acquire(self, now: float, waiter) -> float:
+        """Admits a call if it can start now, without waiting
+
+        :param now: time.monotonic()
+        :param waiter: called without arguments, from any thread, once another call
+        finishes or the limits change, if the call has to wait for that
+        :returns: see _wait
+        """
+        with self._condition:
+            wait = self._wait(now)
+            if wait is None:
+                self._waiters.add(waiter)
+            return wait
+
+    def release(self, admitted: float, failed: bool) -> None:
+        """Marks a call as finished and adapts the window
+
+        :param admitted: time.monotonic() at which the call was admitted
+        :param failed: True if the call failed or timed out, None if it was cancelled,
+        which does not adapt the window
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if self.adaptive and failed is not None:
+                now = time.monotonic()
+                latency = now - admitted
+                if not failed:
+                    drifted = latency if self.baseline is None else self.baseline
+                    self.baseline = min(latency, drifted * self._AIMD_DRIFT)
+                congested = failed or latency > self.baseline * self._AIMD_LATENCY
+                if congested and admitted > self.decreased:
+                    self.window = max(self.window / 2, 1.0)
+                    self.decreased = now
+                elif not congested and self.decreased == float("-inf"):
+                    self.window += 1
+                elif not congested:
+                    self.window += 1 / self.window
+                if self.max_in_flight:
+                    self.window = min(self.window, self.max_in_flight)
+            self._notify()
+
+    def _notify(self) -> None:
+        """Wakes up all waiting calls, the condition must be held"""
+        self._condition.notify_all()
+        for loop, event in self._events.items():
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:  # the loop is closed
+                pass
+        for waiter in self._waiters:
+            waiter()
+        self._events, self._waiters = {}, set()
+
+
+class _TailBuffer:
+    """Ring buffer that keeps the last `size` bytes written to it"""
+
+    def __init__(self, size: int) -> None:
+        """Creates an empty buffer
+
+        :param size: number of bytes to keep
+        """
+        self.size = size
+        self.dropped = 0
+        self._buffer = bytearray()
+
+    def write(self, data: ByteString) -> None:
+        """Adds data to the buffer, dropping the oldest bytes if it is full. Bytes are
+        dropped in batches, so the buffer holds at most twice its size.
+
+        :param data: bytes to add
+        """
+        self._buffer += data
+        if len(self._buffer) > 2 * self.size:
+            excess = len(self._buffer) - self.size
+            del self._buffer[:excess]
+            self.dropped += excess
+
+    def getvalue(self) -> bytes:
+        """Returns the last `size` bytes that were written
+
+        :returns: the bytes, with the number of bytes before them in `dropped`
+        """
+        value = _TailBytes(self._buffer[-self.size :])
+        value.dropped = self.dropped + max(len(self._buffer) - self.size, 0)
+        return value
+
+
+class _TailBytes(bytes):
+    """Bytes of which the first `dropped` bytes were discarded, see _TailBuffer"""
+
+    dropped: int = 0
+
+
+class _StderrLog:
+    """Forwards the stderr output of successful calls to logging. Equal messages of the
+    same command are logged at most once per interval; the number of suppressed
+    repetitions is reported with the next message.
+    """
+
+    def __init__(self) -> None:
+        self._seen = {}  # {(command, hash of stderr): [time logged, suppressed]}
+        self._lock = Lock()
+
+    def forward(self, command: str, stderr: ByteString, interval: float) -> None:
+        """Logs stderr unless the same stderr of command was logged less than interval
+        seconds ago
+
+        :param command: base command of the call, e.g. "git remote"
+        :param stderr: subprocess error output
+        :param interval: minimum number of seconds between logging equal messages
+        """
+        key = (command, hash(stderr))
+        now = time.monotonic()
+        with self._lock:
+            seen = self._seen.get(key)
+            if seen and now - seen[0] < interval:
+                seen[1] += 1
+                return
+            if len(self._seen) > 1024:
+                self._seen.clear()
+            self._seen[key] = [now, 0]
+        repeated = f" (repeated {seen[1]} times)" if seen and seen[1] else ""
+        logger.warning(
+            "%s wrote to stderr%s:\n%s",
+            command,
+            repeated,
+            stderr.decode(errors="replace").rstrip(),
+        )
+
+
+_STDERR_LOG = _StderrLog()
+
+
+class UniversalWrapper:
+    """UniversalWrapper is a convenient shell wrapper for python, allowing you to
+    interact with command line interfaces as if they were Python modules.
+    UniversalWrapper has no code specific to any particular command and the use of
+    UniversalWrapper is in no way limited to the commands below.
+
+    Example usage:
+      ```
+      from universalwrapper import git
+
+      git.clone("https://github.com/Basdbruijne/UniversalWrapper.git")
+      diff = git.diff(name_only=True)
+      ```
+
+    To adjust the behavior of the wrapper, the uw_settings attribute of the wrapper can
+    be adjusted according to the rules defined under `class UwSettings`.
+    """
+
+    def __init__(self, cmd: str, uw_settings: UWSettings = None, **kwargs) -> None:
+        """Loads the default settings and changes the settings if requested
+
+        :param cmd: Base command for the class
+        :uw_settings: Pre-configured UWSettings object
+        :kwargs: {key: value} UWSettings to configure
+        """
+        if uw_settings:
+            self.uw_settings = uw_settings
+        else:
+            self.uw_settings = UWSettings()
+        self.uw_settings.cmd = cmd.replace("_", self.uw_settings.divider)
+        self.uw_settings._reset_command()
+        self._flags_to_remove = []
+
+    @property
+    def __doc__(self):
+        return self._help_index().text
+
+    def __dir__(self) -> List[str]:
+        """Adds the subcommands from the cached help text for autocompletion. The help
+        text is not generated here, see help_index.
+        """
+        index = self._help_index(run=False)
+        subcommands = index.subcommands if index else []
+        divider = self.uw_settings.divider
+        return super().__dir__() + [cmd.replace(divider, "_") for cmd in subcommands]
+
+    def _help_index(self, run: bool = True) -> "HelpIndex":
+        """Returns the parsed help text of the command. With help_cache set, the help
+        text is cached on disk per executable, its modification time and the chain of
+        subcommands, so the command only needs to run once.
+
+        :param run: False to only use the cache and never run the command
+        :returns: HelpIndex, or None if run is False and the help text is not cached
+        """
+        path = (
+            _help_cache_path(self.uw_settings) if self.uw_settings.help_cache else None
+        )
+        if path:
+            try:
+                with open(path) as cache:
+                    return HelpIndex(**json.load(cache))
+            except (OSError, ValueError, TypeError):
+                pass
+        if not run:
+            return None
+        text = self(
+            help=True,
+            _enable_async=False,
+            _parallel=False,
+            _debug=False,
+            _result="",
+            _output_parser="",
+        )
+        index = HelpIndex(text, self.uw_settings.cmd)
+        if path:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(f"{path}.{os.getpid()}", "w") as cache:
+                    json.dump(index.__dict__, cache)
+                os.replace(f"{path}.{os.getpid()}", path)
+            except OSError:
+                pass
+        return index
+
+    def __call__(self, *args: Union[int, str], **kwargs: Union[int, str]) -> str:
+        """Receives the users commands and directs them to the right functions
+
+        :param args: collection of non-keyword arguments for the shell call
+        :param kwargs: collection of keyword arguments for the shell call, can
+        either be `key = value` for `--key value` or `key = True` for `--key`
+        :returns: Response of the shell call
+        """
+        if args and kwargs.get("_chunk_args", self.uw_settings.chunk_args):
+            commands = self._chunk_commands(args, kwargs)
+            if commands is None:
+                return
+            return self._dispatch("_run_chunks", commands)
+        cmd = self._build_command(*args, **kwargs)
+        if self._debug:
+            print(f"Generated command:\n{cmd}")
+            return
+        if isinstance(self._cwd, (list, tuple)) or isinstance(self._env, (list, tuple)):
+            return self._dispatch("_run_fanout", cmd)
+        if self._enable_async:
+            return self._async_run_cmd(cmd)
+        elif self._parallel and self._reactor:
+            return self._submit(cmd)
+        elif self._parallel:
+            return self._snapshot()._run_cmd_parallel(cmd)
+        else:
+            return self._run_cmd(cmd)
+
+    def _build_command(
+        self, *args: Union[int, str], **kwargs: Union[int, str]
+    ) -> List[str]:
+        """Loads the settings and converts the users commands to the final command
+
+        :param args: collection of non-keyword arguments for the shell call
+        :param kwargs: collection of keyword arguments for the shell call
+        :returns: List of strings which combined make the shell command
+        """
+        command = self.uw_settings.cmd.split(" ")
+        self.uw_settings._reset_command()
+        for key in self.uw_settings._incidentals:
+            setattr(self, f"_{key}", getattr(self.uw_settings, key))
+        command.extend(self._generate_command(*args, **kwargs))
+        self._deadline = None
+        if self._timeout is not None:
+            self._deadline = time.monotonic() + self._timeout
+        command = self._input_modifier(command)
+        if self._root:
+            command = ["sudo"] + command
+        return shlex.split(" ".join(command), posix=False)
+
+    def _dispatch(self, name: str, *args) -> Union[str, dict, list]:
+        """Runs a method that makes one or more blocking calls in the mode of the call:
+        in the foreground, in a thread for parallel calls, or in the default executor of
+        the event loop for async calls
+
+        :param name: name of the method to run
+        :param args: arguments for the method
+        :returns: Output of the method, a placeholder of it for parallel calls, or a
+        coroutine that returns a coroutine of it for async calls
+        """
+        if self._enable_async:
+            return self._snapshot()._async_dispatch(name, *args)
+        if self._parallel:
+            return self._snapshot()._run_parallel(name, *args)
+        return getattr(self, name)(*args)
+
+    async def _async_dispatch(self, name: str, *args):
+        """Starts a method in the default executor of the event loop, see _dispatch
+
+        :param name: name of the method to run
+        :param args: arguments for the method
+        :returns: coroutine that returns the output of the method
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, getattr(self, name), *args)
+
+        async def _output():
+            return await future
+
+        return _output()
+
+    @autothread.async_threaded()
+    def _run_parallel(self, name: str, *args) -> Union[str, dict, list]:
+        """Runs a method in the background, see _dispatch
+
+        :param name: name of the method to run
+        :param args: arguments for the method
+        :returns: Output of the method
+        """
+        return getattr(self, name)(*args)
+
+    def _snapshot(self) -> "UniversalWrapper":
+        """Returns a copy of the wrapper with the settings of the current call, so that
+        the wrapper can be called again before this call finished
+
+        :returns: the copy
+        """
+        wrapper = object.__new__(UniversalWrapper)
+        wrapper.__dict__.update(self.__dict__)
+        wrapper._flags_to_remove = list(self._flags_to_remove)
+        return wrapper
+
+    def _chunk_commands(self, args: tuple, kwargs: dict) -> List[List[str]]:
+        """Splits the arguments over as few commands as fit within the systems argument
+        size limit, comparable to xargs
+
+        :param args: collection of non-keyword arguments to divide over the calls
+        :param kwargs: collection of keyword arguments, repeated for every call
+        :returns: the commands, None in debug mode
+        """
+        template = self._build_command(_ARGS_PLACEHOLDER, **kwargs)
+        if isinstance(self._cwd, (list, tuple)) or isinstance(self._env, (list, tuple)):
+            raise ValueError("chunk_args can not be combined with a list of cwd or env")
+        index = template.index(_ARGS_PLACEHOLDER)
+        arguments = shlex.split(
+            " ".join(self._format_arg(arg) for arg in args), posix=False
+        )
+        commands = [
+            template[:index] + chunk + template[index + 1 :]
+            for chunk in self._chunk_arguments(arguments, template, index)
+        ]
+        if self._result == "lazy" and len(commands) > 1:
+            raise ValueError("result='lazy' can not be combined with chunked calls")
+        if self._debug:
+            for cmd in commands:
+                print(f"Generated command:\n{cmd}")
+            return None
+        return commands
+
+    def _run_chunks(self, commands: List[List[str]]) -> Union[str, dict, list]:
+        """Runs the chunked commands in order, or concurrently when chunk_workers > 1,
+        after which the outputs are merged in order
+
+        :param commands: the commands, see _chunk_commands
+        :returns: Merged output of the shell calls
+        """
+
+        def _run(cmd):
+            try:
+                return self._run_cmd(cmd), None
+            except SubprocessError as error:
+                return None, error
+
+        if self._chunk_workers > 1 and len(commands) > 1:
+            with ThreadPoolExecutor(self._chunk_workers) as executor:
+                results = list(executor.map(_run, commands))
+        else:
+            results = [_run(cmd) for cmd in commands]
+        outputs = [output for output, _ in results]
+        errors = [error for _, error in results if error is not None]
+        if errors:
+            raise SubprocessErrorGroup(errors, outputs)
+        return _merge_outputs(outputs, self._output_parser)
+
+    def _run_fanout(self, cmd: List[str]) -> dict:
+        """Runs the same command in each of the contexts given by a list of cwd and/or
+        env, using up to fanout_workers concurrent calls. If both are lists, they are
+        paired up.
+
+        :param cmd: List of string which combined make the shell command
+        :returns: {cwd (or index of env): output or raised exception}
+        """
+        cwds, envs = self._cwd, self._env
+        if isinstance(cwds, (list, tuple)) and isinstance(envs, (list, tuple)):
+            if len(cwds) != len(envs):
+                raise ValueError("A list of cwd and env must be of the same length")
+            keys, contexts = cwds, list(zip(cwds, envs))
+        elif isinstance(cwds, (list, tuple)):
+            keys, contexts = cwds, [(cwd, envs) for cwd in cwds]
+        else:
+            keys, contexts = range(len(envs)), [(cwds, env) for env in envs]
+        if not contexts:
+            return {}
+
+        def _run(context):
+            cwd, env = context
+            try:
+                return self._run_cmd(cmd, cwd=cwd, env=env)
+            except (SubprocessError, OSError) as error:
+                return error
+
+        workers = max(min(self._fanout_workers, len(contexts)), 1)
+        with ThreadPoolExecutor(workers) as executor:
+            return dict(zip(keys, executor.map(_run, contexts)))
+
+    def _chunk_arguments(
+        self, arguments: List[str], template: List[str], index: int
+    ) -> List[List[str]]:
+        """Divides the arguments in chunks that fit within ARG_MAX together with the
+        rest of the command and the environment
+
+        :param arguments: Arguments to divide
+        :param template: Command that the arguments will be inserted in
+        :param index: Index of the placeholder in the template
+        :returns: List of chunks of arguments
+        """
+        env = self._popen_kwargs()["env"]
+        env = os.environ if env is None else env
+        fixed = sum(_arg_size(arg) for i, arg in enumerate(template) if i != index)
+        fixed += sum(_arg_size(f"{key}={value}") for key, value in env.items())
+        budget = max(_arg_max() - fixed, 1)
+        chunks, chunk, size = [], [], 0
+        for arg in arguments:
+            arg_size = _arg_size(arg)
+            if chunk and size + arg_size > budget:
+                chunks.append(chunk)
+                chunk, size = [], 0
+            chunk.append(arg)
+            size += arg_size
+        chunks.append(chunk)
+        return chunks
+
+    def _generate_command(
+        self, *args: Union[int, str], **kwargs: Union[int, str]
+    ) -> List[str]:
+        """Transforms the args and kwargs to bash arguments and flags
+
+        :param args: collection of non-keyword arguments for the shell call
+        :param kwargs: collection of keyword arguments for the shell call
+        :returns: Shell call
+        """
+        command = []
+        self._root = False
+        for string in args:
+            command.append(self._format_arg(string))
+        for key, values in kwargs.items():
+            if key.startswith("_") and key[1:] in self.uw_settings._incidentals:
+                if key[1:] in self.uw_settings._depricated:
+                    self.uw_settings.deprecationwarning(key[1:], stacklevel=4)
+                setattr(self, key, values)
+            else:
+                if type(values) != list:
+                    values = [values]
+                for value in values:
+                    if value is False:
+                        self._flags_to_remove.append(self._add_dashes(key))
+                    else:
+                        command.append(self._add_dashes(key))
+                        command[-1] += f" {value}" * (not value is True)
+        return command
+
+    def _format_arg(self, arg: Union[int, str]) -> str:
+        """Converts a non-keyword argument to a string, quoting it if it contains
+        spaces
+
+        :param arg: argument to convert
+        :returns: argument as string
+        """
+        if " " in str(arg):
+            return f"'{arg}'"
+        return str(arg)
+
+    def _add_dashes(self, flag: str) -> str:
+        """Adds the right number of dashes for the bash flags based on the
+        convention that single lettered flags get a single dash and multi-
+        lettered flags get a double dash
+
+        :param flag: flag to add dashes to
+        :returns: flag with dashes
+        """
+        if len(str(flag)) > 1 and self._double_dash:
+            return f"--{flag.replace('_', self.uw_settings.flag_divider)}"
+        else:
+            return f"-{flag}"
+
+    def _input_modifier(self, command: List[str]) -> List[str]:
+        """Handles the input modifiers, e.g. adding and moving commands
+
+        :param command: List of initial commands
+        :returns: Modified list of commands based on uw_settings input
+        modifiers
+        """
+        for input_command, index in self.uw_settings.input_add.items():
+            if not input_command.split(" ")[0] in self._flags_to_remove:
+                command = self._insert_command(command, input_command, index)
+        self._flags_to_remove = []
+        for move_command, index in self.uw_settings.input_move.items():
+            cmd = [cmd.split(" ")[0] for cmd in command]
+            if move_command in cmd:
+                command_index = cmd.index(move_command)
+                popped_command = command.pop(command_index)
+                command = self._insert_command(command, popped_command, index)
+        for cmd in self.uw_settings.input_custom:
+            exec(cmd)
+        return command
+
+    def _insert_command(
+        self, command: List[str], input_command: str, index: int
+    ) -> List[str]:
+        """Combines list.append and list.inset to a continues insert function
+
+        :param command: Initial command to add items to
+        :param input_command: Item to add to command
+        :param index: Index to add command, must be in range(0, len(command))
+        or -1
+        :returns: Modified command
+        """
+        if index == -1:
+            command.append(input_command)
+            return command
+        elif index < 0:
+            index += 1
+        command.insert(index, input_command)
+        return command
+
+    def _popen_kwargs(self, group: bool = False, **overrides) -> dict:
+        """Collects the keyword arguments for starting the subprocess
+
+        :param group: start the subprocess in its own process group even if the call
+        has no timeout, for calls that can be cancelled
+        :param overrides: Keyword arguments that replace the configured ones, e.g.
+        the cwd of a single fan-out call
+        :returns: Keyword arguments for subprocess
+        """
+        kwargs = {"cwd": self._cwd, "env": self._env, **overrides}
+        if group or self._deadline is not None:
+            kwargs.update(_PROCESS_GROUP)  # to terminate the whole process group
+        if self._env_overlay:
+            kwargs["env"] = _overlay_env(kwargs["env"], self._env_overlay)
+        return kwargs
+
+    def _executable(self, cmd: List[str], env: dict = None) -> List[str]:
+        """Replaces the executable of the command by its absolute path if
+        resolve_executable is set. The lookup is cached per PATH, so the PATH is only
+        searched once and a missing executable is detected without starting a process.
+
+        :param cmd: List of string which combined make the shell command
+        :param env: environment the command will run in
+        :returns: cmd with the absolute path of the executable
+        """
+        if not self._resolve_executable or os.sep in cmd[0]:
+            return cmd
+        path = (os.environ if env is None else env).get("PATH", os.defpath)
+        return [_which(cmd[0], path)] + cmd[1:]
+
+    def _run_cmd(self, cmd: List[str], **overrides) -> str:
+        """Forwards the generated command to subprocess
+
+        :param: List of string which combined make the shell command
+        :param overrides: Keyword arguments to replace the configured cwd or env
+        :returns: Output of shell command
+        """
+        kwargs = self._popen_kwargs(**overrides)
+        if self._inputs is not None:
+            key, inputs, cached = self._incremental_lookup(cmd, kwargs)
+            if cached:
+                return self._raise_or_return(*cached, 0, cmd, 0.0)
+        stdout, stderr, returncode, duration = self._execute(cmd, kwargs)
+        if self._inputs is not None and returncode == 0:
+            self._incremental_store(key, inputs, kwargs, stdout, stderr)
+        return self._raise_or_return(stdout, stderr, returncode, cmd, duration)
+
+    def _execute(self, cmd: List[str], kwargs: dict) -> tuple:
+        """Runs the command with the configured backend and waits for it to finish
+
+        :param: List of string which combined make the shell command
+        :param kwargs: Keyword arguments for subprocess, see _popen_kwargs
+        :returns: stdout, stderr, return code and duration of the call
+        """
+        if not self._backend:
+            return self._spawn(cmd, kwargs)
+        if self._backend not in ("record", "replay"):
+            raise ValueError(f"Unknown backend {self._backend}, use record or replay")
+        if not self._fixture:
+            raise ValueError(f"The {self._backend} backend requires a fixture file")
+        fixture = _fixture(self._fixture, self._backend)
+        env = os.environ if kwargs["env"] is None else kwargs["env"]
+        names = set(self._fixture_env or []) | set(self._env_overlay or {})
+        env = {name: env.get(name) for name in sorted(names)}
+        if self._backend == "replay":
+            return fixture.replay(cmd, kwargs["cwd"], env)
+        result = self._spawn(cmd, kwargs)
+        fixture.record(cmd, kwargs["cwd"], env, *result)
+        return result
+
+    def _spawn(self, cmd: List[str], kwargs: dict) -> tuple:
+        """Runs the command in a subprocess within the limits of its limit_key
+
+        :param: List of string which combined make the shell command
+        :param kwargs: Keyword arguments for subprocess, see _popen_kwargs
+        :returns: stdout, stderr, return code and duration of the call
+        """
+        limiter = self._limiter()
+        if limiter is None:
+            return self._popen(cmd, kwargs)
+        started = self._admit(limiter, cmd)
+        returncode = None
+        try:
+            result = self._popen(cmd, kwargs)
+            returncode = result[2]
+            return result
+        finally:
+            limiter.release(started, returncode != 0)
+
+    def _limiter(self) -> "_Limiter":
+        """Returns the limiter of the call, configured with its current settings
+
+        :returns: the limiter, None if the call has no limits
+        """
+        if not (self._max_in_flight or self._rate_limit or self._adaptive):
+            return None
+        limiter = _shared_limiter(self._limit_key or self.uw_settings.cmd)
+        limiter.configure(
+            self._max_in_flight, self._rate_limit, self._rate_burst, self._adaptive
+        )
+        return limiter
+
+    def _admit(self, limiter: "_Limiter", cmd: List[str]) -> float:
+        """Waits until the limiter admits the call
+
+        :param limiter: limiter of the call
+        :param cmd: List of string which combined make the shell command
+        :returns: time.monotonic() at which the call was admitted
+        """
+        try:
+            return limiter.acquire(self._remaining())
+        except TimeoutError:
+            raise SubprocessTimeoutError(cmd, self._timeout, b"", b"") from None
+
+    def _popen(self, cmd: List[str], kwargs: dict) -> tuple:
+        """Runs the command in a subprocess and waits for it to finish
+
+        :param: List of string which combined make the shell command
+        :param kwargs: Keyword arguments for subprocess, see _popen_kwargs
+        :returns: stdout, stderr, return code and duration of the call
+        """
+        start = time.monotonic()
+        if self._remaining() == 0:
+            raise SubprocessTimeoutError(cmd, self._timeout, b"", b"")
+        if self._executor:
+            return self._remote_execute(cmd, kwargs)
+        proc = self._start(cmd, kwargs)
+        try:
+            stdout, stderr = self._communicate(proc)
+        except subprocess.TimeoutExpired as error:
+            raise SubprocessTimeoutError(
+                cmd, self._timeout, error.output, error.stderr, proc.returncode
+            ) from None
+        return stdout, stderr, proc.returncode, time.monotonic() - start
+
+    def _start(self, cmd: List[str], kwargs: dict) -> subprocess.Popen:
+        """Starts the command in a subprocess with pipes for its output
+
+        :param: List of string which combined make the shell command
+        :param kwargs: Keyword arguments for subprocess, see _popen_kwargs
+        :returns: the started process
+        """
+        return subprocess.Popen(
+            self._executable(cmd, kwargs["env"]),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            **kwargs,
+        )
+
+    def _remote_execute(self, cmd: List[str], kwargs: dict) -> tuple:
+        """Runs the command in the executor daemon and waits for it to finish. The
+        daemon streams the output back while the command runs.
+
+        :param: List of string which combined make the shell command
+        :param kwargs: Keyword arguments for subprocess, see _popen_kwargs
+        :returns: stdout, stderr, return code and duration of the call
+        """
+        start = time.monotonic()
+        env = os.environ if kwargs["env"] is None else kwargs["env"]
+        request = {
+            "cmd": self._executable(cmd, kwargs["env"]),
+            "cwd": os.path.abspath(kwargs["cwd"] or os.curdir),
+            "env": dict(env),
+            "timeout": self._remaining(),
+            "timeout_grace": self._timeout_grace,
+        }
+        stdout = io.BytesIO()
+        stderr = (
+            _TailBuffer(self._max_stderr_bytes)
+            if self._max_stderr_bytes
+            else io.BytesIO()
+        )
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(_socket_path(self._executor))
+            _send_frame(sock, b"r", json.dumps(request).encode())
+            while True:
+                kind, payload = _recv_frame(sock)
+                if kind == b"o":
+                    stdout.write(payload)
+                elif kind == b"e":
+                    stderr.write(payload)
+                elif kind == b"x":
+                    status = json.loads(payload)
+                    break
+                else:
+                    raise ConnectionError(f"Executor {self._executor} hung up")
+        if "errno" in status:
+            raise OSError(status["errno"], status["strerror"], status["filename"])
+        if status["timed_out"]:
+            raise SubprocessTimeoutError(
+                cmd,
+                self._timeout,
+                stdout.getvalue(),
+                stderr.getvalue(),
+                status["returncode"],
+            )
+        return (
+            stdout.getvalue(),
+            stderr.getvalue(),
+            status["returncode"],
+            time.monotonic() - start,
+        )
+
+    def _submit(self, cmd: List[str]) -> "ParallelCall":
+        """Starts the command and hands its pipes to the reactor thread. Calls with
+        limits are queued in the reactor, which starts them once they are admitted, so
+        the calling thread never waits. Calls that go through the executor, a backend
+        or the incremental cache use a thread instead.
+
+        :param: List of string which combined make the shell command
+        :returns: future of the output of the call
+        """
+        if self._executor or self._backend or self._inputs is not None:
+            return self._snapshot()._run_cmd_parallel(cmd)
+        wrapper = self._snapshot()
+        call = ParallelCall(wrapper, cmd)
+        if self._remaining() == 0:
+            call.set_exception(SubprocessTimeoutError(cmd, self._timeout, b"", b""))
+            return call
+        kwargs = self._popen_kwargs(group=True)
+        call_state = _ReactorCall(wrapper, cmd, kwargs, call, self._limiter())
+        if call_state.limiter is None:
+            try:
+                call_state.proc = self._start(cmd, kwargs)
+            except OSError as error:
+                call.set_exception(error)
+                return call
+        _reactor().submit(call_state)
+        return call
+
+    @autothread.async_threaded()
+    def _run_cmd_parallel(self, cmd: List[str]) -> Union[str, dict, list]:
+        """Forwards the generated command to subprocess
+
+        :param: List of string which combined make the shell command
+        :returns: Output of shell command
+        """
+        return self._run_cmd(cmd)
+
+    async def _async_run_cmd(self, cmd: List[str]) -> str:
+        """Forwards the generated command to async subprocess
+
+        :param: List of string which combined make the shell command
+        :returns: Output of shell command
+        """
+        kwargs = self._popen_kwargs(group=True)
+        key = inputs = None
+        if self._inputs is not None:
+            key, inputs, cached = self._incremental_lookup(cmd, kwargs)
+            if cached:
+
+                async def _cached():
+                    return self._raise_or_return(*cached, 0, cmd, 0.0)
+
+                return _cached()
+        if self._executor or self._backend:
+            future = asyncio.get_running_loop().run_in_executor(
+                None, self._execute, cmd, kwargs
+            )
+
+            async def _remote():
+                stdout, stderr, returncode, duration = await future
+                if self._inputs is not None and returncode == 0:
+                    self._incremental_store(key, inputs, kwargs, stdout, stderr)
+                return self._raise_or_return(stdout, stderr, returncode, cmd, duration)
+
+            return _remote()
+        limiter = self._limiter()
+        if limiter is not None:
+            # The process starts when the output is awaited, so that calls that wait
+            # for admission don't block the creation of the calls they wait for
+            async def _limited():
+                try:
+                    started = await limiter.async_acquire(self._remaining())
+                except TimeoutError:
+                    raise SubprocessTimeoutError(cmd, self._timeout, b"", b"") from None
+                failed = True
+                try:
+                    proc = await self._async_popen(cmd, kwargs)
+                    try:
+                        return await self._async_output(
+                            proc, cmd, kwargs, started, key, inputs
+                        )
+                    except asyncio.CancelledError:
+                        self._async_terminate(proc)
+                        raise
+                    finally:
+                        failed = proc.returncode != 0
+                except asyncio.CancelledError:
+                    failed = None  # a cancelled call does not adapt the window
+                    raise
+                finally:
+                    limiter.release(started, failed)
+
+            return _limited()
+        start = time.monotonic()
+        proc = await self._async_popen(cmd, kwargs)
+        # The process already runs, so it must be terminated when the output is
+        # cancelled, also when that happens before the output is first awaited
+        output = asyncio.ensure_future(
+            self._async_output(proc, cmd, kwargs, start, key, inputs)
+        )
+        output.add_done_callback(
+            lambda task: task.cancelled() and self._async_terminate(proc)
+        )
+        return output
+
+    async def _async_popen(self, cmd: List[str], kwargs: dict):
+        """Starts the command in an async subprocess
+
+        :param: List of string which combined make the shell command
+        :param kwargs: Keyword arguments for subprocess, see _popen_kwargs
+        :returns: the process, asyncio.subprocess.Process or _PidfdProcess
+        """
+        if self._remaining() == 0:
+            raise SubprocessTimeoutError(cmd, self._timeout, b"", b"")
+        if self._pidfd and _pidfd_supported():
+            proc = _PidfdProcess(
+                subprocess.Popen(
+                    self._executable(cmd, kwargs["env"]),
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    **kwargs,
+                )
+            )
+        else:
+            proc = await asyncio.create_subprocess_exec(
+                *self._executable(cmd, kwargs["env"]),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                **kwargs,
+            )
+
+        return proc
+
+    async def _async_output(
+        self, proc, cmd: List[str], kwargs: dict, start: float, key: str, inputs: str
+    ) -> str:
+        """Waits for the async subprocess to finish and processes its output
+
+        :param proc: the running subprocess
+        :param: List of string which combined make the shell command
+        :param kwargs: Keyword arguments for subprocess, see _popen_kwargs
+        :param start: time.monotonic() at which the call started
+        :param key: key of the run for the incremental cache, if inputs is set
+        :param inputs: digest of the inputs for the incremental cache
+        :returns: Output of shell command
+        """
+        try:
+            stdout, stderr = await self._async_communicate(proc)
+        except subprocess.TimeoutExpired as error:
+            raise SubprocessTimeoutError(
+                cmd, self._timeout, error.output, error.stderr, proc.returncode
+            ) from None
+        duration = time.monotonic() - start
+        if self._inputs is not None and proc.returncode == 0:
+            self._incremental_store(key, inputs, kwargs, stdout, stderr)
+        if proc.returncode == 0 and self._offload_parse(stdout):
+            output = self._raise_or_return(
+                stdout, stderr, proc.returncode, cmd, duration, parse=False
+            )
+            return await asyncio.get_running_loop().run_in_executor(
+                _parse_pool(self._parse_pool), _parse, self._output_parser, output
+            )
+        return self._raise_or_return(stdout, stderr, proc.returncode, cmd, duration)
+
+    def _incremental_lookup(self, cmd: List[str], kwargs: dict) -> tuple:
+        """Looks up a previous successful run of the command with the same inputs. The
+        run is only reused if the outputs are unchanged since then as well.
+
+        :param cmd: List of string which combined make the shell command
+        :param kwargs: Keyword arguments for subprocess, see _popen_kwargs
+        :returns: key of the run, digest of the inputs and (stdout, stderr) of the
+        previous run, or None if the command needs to run
+        """
+        cwd = os.path.abspath(kwargs["cwd"] or os.curdir)
+        env = None if kwargs["env"] is None else dict(kwargs["env"])
+        key = json.dumps([cmd, cwd, env], sort_keys=True)
+        key = hashlib.sha256(key.encode()).hexdigest()
+        inputs = _digest_paths(self._inputs, cwd)
+        run = _RunCache(self._cache_dir).get(key)
+        if run and run[0] == inputs and run[1] == _digest_paths(self._outputs, cwd):
+            return key, inputs, run[2:]
+        return key, inputs, None
+
+    def _incremental_store(
+        self,
+        key: str,
+        inputs: str,
+        kwargs: dict,
+        stdout: ByteString,
+        stderr: ByteString,
+    ) -> None:
+        """Stores a successful run, see _incremental_lookup
+
+        :param key: key of the run
+        :param inputs: digest of the inputs before the run
+        :param kwargs: Keyword arguments for subprocess, see _popen_kwargs
+        :param stdout: subprocess output
+        :param stderr: subprocess error output
+        """
+        cwd = os.path.abspath(kwargs["cwd"] or os.curdir)
+        outputs = _digest_paths(self._outputs, cwd)
+        _RunCache(self._cache_dir).put(key, inputs, outputs, stdout, stderr)
+
+    def _remaining(self) -> float:
+        """Returns the time left before the deadline of the call
+
+        :returns: seconds left, None if the call has no timeout
+        """
+        if self._deadline is None:
+            return None
+        return max(self._deadline - time.monotonic(), 0)
+
+    def _communicate(self, proc: subprocess.Popen) -> tuple:
+        """Reads the output of the subprocess until it finishes. If max_stderr_bytes is
+        set, only the tail of stderr is kept in memory. If the deadline passes, the
+        process (group) is terminated and subprocess.TimeoutExpired is raised with the
+        output collected so far. If waiting is interrupted, e.g. by KeyboardInterrupt,
+        the process (group) is terminated as well.
+
+        :param proc: the running subprocess
+        :returns: stdout, stderr
+        """
+        timeout = self._remaining()
+        if not self._max_stderr_bytes:
+            try:
+                return proc.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                self._terminate(proc)
+                stdout, stderr = proc.communicate()
+                raise subprocess.TimeoutExpired(proc.args, timeout, stdout, stderr)
+            except BaseException:
+                self._terminate(proc)
+                raise
+        stdout, stderr = io.BytesIO(), _TailBuffer(self._max_stderr_bytes)
+        readers = [
+            Thread(target=_drain, args=(proc.stdout, stdout), daemon=True),
+            Thread(target=_drain, args=(proc.stderr, stderr), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+        try:
+            proc.wait(timeout)
+            timed_out = False
+        except subprocess.TimeoutExpired:
+            self._terminate(proc)
+            timed_out = True
+        except BaseException:
+            self._terminate(proc)
+            raise
+        for reader in readers:
+            reader.join()
+        if timed_out:
+            raise subprocess.TimeoutExpired(
+                proc.args, timeout, stdout.getvalue(), stderr.getvalue()
+            )
+        return stdout.getvalue(), stderr.getvalue()
+
+    def _terminate(self, proc: subprocess.Popen) -> None:
+        """Terminates the process (group), and kills it if it did not exit within
+        timeout_grace seconds
+
+        :param proc: the running subprocess
+        """
+        _signal(proc, signal.SIGTERM, self._deadline is not None)
+        try:
+            proc.wait(self._timeout_grace)
+        except subprocess.TimeoutExpired:
+            pass
+        _signal(proc, _SIGKILL, self._deadline is not None)
+        proc.wait()
+
+    async def _async_communicate(self, proc: asyncio.subprocess.Process) -> tuple:
+        """Reads the output of the async subprocess until it finishes. If
+        max_stderr_bytes is set, only the tail of stderr is kept in memory. If the
+        deadline passes, the process (group) is terminated and subprocess.TimeoutExpired
+        is raised with the output collected so far.
+
+        :param proc: the running subprocess
+        :returns: stdout, stderr
+        """
+        timeout = self._remaining()
+        group = True  # async calls always run in their own process group
+        if timeout is None and not self._max_stderr_bytes:
+            return await proc.communicate()
+        stdout = io.BytesIO()
+        stderr = (
+            _TailBuffer(self._max_stderr_bytes)
+            if self._max_stderr_bytes
+            else io.BytesIO()
+        )
+
+        async def _async_drain(stream, buffer):
+            while True:
+                chunk = await stream.read(65536)
+                if not chunk:
+                    break
+                buffer.write(chunk)
+
+        task = asyncio.ensure_future(
+            asyncio.gather(
+                _async_drain(proc.stdout, stdout),
+                _async_drain(proc.stderr, stderr),
+                proc.wait(),
+            )
+        )
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            _signal(proc, signal.SIGTERM, group)
+            try:
+                await asyncio.wait_for(asyncio.shield(task), self._timeout_grace)
+            except asyncio.TimeoutError:
+                pass
+            _signal(proc, _SIGKILL, group)
+            await task
+            raise subprocess.TimeoutExpired(
+                None, timeout, stdout.getvalue(), stderr.getvalue()
+            )
+        return stdout.getvalue(), stderr.getvalue()
+
+    def _async_terminate(self, proc: asyncio.subprocess.Process) -> None:
+        """Terminates the process group of a cancelled async call, and kills it if it
+        is still running after timeout_grace
+
+        :param proc: the running subprocess
+        """
+        _signal(proc, signal.SIGTERM, True)
+        asyncio.get_running_loop().call_later(
+            self._timeout_grace, _signal, proc, _SIGKILL, True
+        )
+
+    def _raise_or_return(
+        self,
+        stdout: ByteString,
+        stderr: ByteString,
+        return_code: int,
+        cmd: List[str],
+        duration: float = None,
+        parse: bool = True,
+    ) -> str:
+        """Handles the error displaying for the subprocesses
+
+        :param stdout: subprocess output
+        :param stderr: subprocess error output
+        :param return_code: return code of the process
+        :param cmd: original command, used for error message
+        :param duration: time in seconds the call took
+        :param parse: False to return the output unparsed, so that it can be parsed
+        in the parse pool
+        :returns: Output of shell command
+        """
+        if return_code == 0:
+            if stderr and self._log_stderr:
+                _STDERR_LOG.forward(
+                    self.uw_settings.cmd, stderr, self._log_stderr_interval
+                )
+            elif stderr and self._warn_stderr:
+                warnings.warn("\n" + stderr.decode(), UserWarning, stacklevel=4)
+            if self._result == "lazy":
+                return CommandResult(cmd, return_code, stdout, stderr, duration)
+            elif self._result:
+                raise ValueError(f"{self._result} is not a valid result, choose lazy")
+            if self._return_stderr:
+                stdout = stderr + b"\n" + stdout
+            if self._output_parser and not parse:
+                return stdout
+            elif self._output_parser:
+                return self._parse_output(stdout)
+            else:
+                return self._output_modifier(stdout)
+        raise SubprocessError(return_code, cmd, stdout, stderr)
+
+    def _parse_output(self, output: ByteString):
+        """Parses the output with the configured output_parser. Outputs of at least
+        parse_offload bytes are parsed in the shared parse pool.
+
+        :param output: subprocess output
+        :returns: parsed output
+        """
+        if self._offload_parse(output):
+            pool = _parse_pool(self._parse_pool)
+            return pool.submit(_parse, self._output_parser, output).result()
+        return _parse(self._output_parser, output)
+
+    def _offload_parse(self, output: ByteString) -> bool:
+        """Checks whether the parsing of output should be done in the parse pool
+
+        :param output: subprocess output
+        :returns: True if the output should be parsed in the parse pool
+        """
+        return bool(
+            self._parse_offload
+            and self._output_parser
+            and not self._result
+            and len(output) >= self._parse_offload
+        )
+
+    def _output_modifier(self, output: str) -> str:
+        """Modifies the subprocess' output according to uw_settings
+
+        :param output: string to modify, e.g. parse
+        :returns: modified output
+        """
+        if self._output_decode:
+            output = output.decode()
+        if self._output_yaml:
+            output = yaml.safe_load(output)
+        if self._output_json:
+            output = json.loads(output)
+        if self._output_splitlines:
+            output = output.splitlines()
+        for cmd in self.uw_settings.output_custom:
+            exec(cmd)
+        return output
+
+    def __getattr__(self, attr):
+        """Handles the creation of (sub)classes"""
         subclass = UniversalWrapper(
             f"{self.uw_settings.cmd}{self.uw_settings.class_divider}"
             f"{attr.replace('_', self.uw_settings.divider)}",
@@ -400,6 +2531,1069 @@ class UniversalWrapper:
         return subclass
 
 
+class GraphError(Exception):
+    """Error raised by Graph.run when one or more nodes failed. The nodes that depend on
+    the failed nodes are cancelled.
+    """
+
+    def __init__(self, failed: List["GraphNode"], cancelled: List["GraphNode"]) -> None:
+        """Collects the failed and cancelled nodes
+
+        :param failed: nodes that raised an error
+        :param cancelled: nodes that did not run because a dependency failed
+        """
+        super().__init__(failed, cancelled)
+        self.failed = failed
+        self.cancelled = cancelled
+
+    def __str__(self) -> str:
+        """Compiles the errors of the failed nodes to an error message
+
+        :returns: Error message
+        """
+        msg = f"{len(self.failed)} node(s) failed"
+        if self.cancelled:
+            cancelled = ", ".join(node.name for node in self.cancelled)
+            msg += f", cancelled: {cancelled}"
+        for node in self.failed:
+            msg += f"\n{node.name}: {node.error}"
+        return msg
+
+
+class GraphNode:
+    """A prepared call of a wrapped command in a Graph, see Graph.add"""
+
+    def __init__(
+        self,
+        wrapper: UniversalWrapper,
+        args: tuple,
+        kwargs: dict,
+        after: List["GraphNode"],
+        name: str,
+    ) -> None:
+        """Stores the call
+
+        :param wrapper: wrapped command to call
+        :param args: collection of non-keyword arguments for the call
+        :param kwargs: collection of keyword arguments for the call
+        :param after: nodes that need to finish before this node starts
+        :param name: name of the node used in the summary
+        """
+        self.wrapper = wrapper
+        self.args = args
+        self.kwargs = kwargs
+        self.after = after
+        self.name = name
+        self.state = "pending"  # pending, running, done, failed or cancelled
+        self.result = None
+        self.error = None
+        self.start = None
+        self.end = None
+
+    @property
+    def duration(self) -> float:
+        """Time in seconds the node ran, None if it did not run"""
+        if self.start is None or self.end is None:
+            return None
+        return self.end - self.start
+
+    def _run(self, deadline: float = None) -> object:
+        """Calls the wrapped command, in the foreground
+
+        :param deadline: time.monotonic() value by which the call needs to finish
+        :returns: Output of the call
+        """
+        self.start = time.monotonic()
+        try:
+            kwargs = {**self.kwargs, "_enable_async": False, "_parallel": False}
+            if deadline is not None:
+                remaining = deadline - self.start
+                if "_timeout" in kwargs and kwargs["_timeout"] is not None:
+                    remaining = min(remaining, kwargs["_timeout"])
+                kwargs["_timeout"] = max(remaining, 0)
+            # nodes that share a wrapper run concurrently, each call gets its own copy
+            return self.wrapper._snapshot()(*self.args, **kwargs)
+        finally:
+            self.end = time.monotonic()
+
+    def __repr__(self) -> str:
+        return f"GraphNode({self.name!r}, state={self.state!r})"
+
+
+class Graph:
+    """Runs wrapped commands that depend on each other. Every node starts as soon as
+    the nodes it depends on finished, with at most max_workers nodes running at the
+    same time. When a node fails, the nodes that depend on it are cancelled.
+
+    Example usage:
+      ```
+      import universalwrapper as uw
+      from universalwrapper import docker, kubectl
+
+      graph = uw.Graph(max_workers=4)
+      build = graph.add(docker.build, ".", tag="app")
+      pushes = [
+          graph.add(docker.push, f"{registry}/app", _after=[build])
+          for registry in ("reg1", "reg2", "reg3")
+      ]
+      graph.add(kubectl.rollout.restart, "deployment/app", _after=pushes)
+      results = graph.run()
+      print(graph.summary())
+      ```
+    """
+
+    def __init__(self, max_workers: int = 4) -> None:
+        """Creates an empty graph
+
+        :param max_workers: max number of nodes that run at the same time
+        """
+        self.max_workers = max_workers
+        self.nodes: List[GraphNode] = []
+        self.start = None
+        self.end = None
+
+    def add(
+        self,
+        wrapper: UniversalWrapper,
+        *args: Union[int, str],
+        _after: List[GraphNode] = (),
+        _name: str = None,
+        **kwargs: Union[int, str],
+    ) -> GraphNode:
+        """Adds a call of a wrapped command to the graph, without running it
+
+        :param wrapper: wrapped command to call, e.g. `git.push`
+        :param args: collection of non-keyword arguments for the call
+        :param _after: nodes that need to finish before this node starts
+        :param _name: name of the node used in the summary, defaults to the command
+        :param kwargs: collection of keyword arguments for the call
+        :returns: the node, to be used in `_after` of other nodes
+        """
+        for node in _after:
+            if node not in self.nodes:
+                raise ValueError(f"{node} is not part of this graph")
+        name = _name or " ".join([wrapper.uw_settings.cmd, *map(str, args)])
+        node = GraphNode(wrapper, args, kwargs, list(_after), name)
+        self.nodes.append(node)
+        return node
+
+    def run(self, timeout: float = None) -> Dict[GraphNode, object]:
+        """Runs all nodes of the graph
+
+        :param timeout: seconds in which the whole graph needs to finish, every node
+        gets the time that is left as its timeout
+        :returns: {node: output of the call}
+        """
+        pending = list(self.nodes)
+        running = {}
+        for node in self.nodes:
+            node.state, node.result, node.error = "pending", None, None
+        self.start = time.monotonic()
+        deadline = self.start + timeout if timeout is not None else None
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            while pending or running:
+                for node in list(pending):
+                    if all(dep.state == "done" for dep in node.after):
+                        pending.remove(node)
+                        node.state = "running"
+                        running[executor.submit(node._run, deadline)] = node
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    try:
+                        node.result = future.result()
+                        node.state = "done"
+                    except Exception as error:
+                        node.error = error
+                        node.state = "failed"
+                        self._cancel_dependents(node, pending)
+        self.end = time.monotonic()
+        failed = [node for node in self.nodes if node.state == "failed"]
+        if failed:
+            cancelled = [node for node in self.nodes if node.state == "cancelled"]
+            raise GraphError(failed, cancelled)
+        return {node: node.result for node in self.nodes}
+
+    def _cancel_dependents(self, failed: GraphNode, pending: List[GraphNode]) -> None:
+        """Cancels the pending nodes that (indirectly) depend on a failed node
+
+        :param failed: node that failed
+        :param pending: nodes that did not start yet, cancelled nodes are removed
+        """
+        for node in list(pending):
+            if failed in node.after:
+                pending.remove(node)
+                node.state = "cancelled"
+                self._cancel_dependents(node, pending)
+
+    def critical_path(self) -> List[GraphNode]:
+        """Returns the chain of nodes that determined the duration of the last run:
+        starting from the node that finished last, the dependency that finished last is
+        followed back to the first node.
+
+        :returns: nodes on the critical path, in order of execution
+        """
+        finished = [node for node in self.nodes if node.end is not None]
+        if not finished:
+            return []
+        path = [max(finished, key=lambda node: node.end)]
+        while True:
+            deps = [dep for dep in path[-1].after if dep.end is not None]
+            if not deps:
+                return path[::-1]
+            path.append(max(deps, key=lambda node: node.end))
+
+    def summary(self) -> str:
+        """Returns the timing of the last run, nodes on the critical path are marked
+        with a *
+
+        :returns: summary of the timing
+        """
+        critical = self.critical_path()
+        total = (self.end or 0) - (self.start or 0)
+        lines = [f"Total: {total:.2f}s"]
+        for node in self.nodes:
+            timing = "-" if node.duration is None else f"{node.duration:.2f}s"
+            mark = "*" if node in critical else " "
+            lines.append(f"{mark} {node.name}: {timing} ({node.state})")
+        return "\n".join(lines)
+
+
+class ExecutorServer:
+    """Daemon that runs commands for the wrappers of all local processes that have
+    uw_settings.executor set to its address. Commands are queued until one of the
+    max_workers slots is free, at most rate commands are started per second and the
+    output is streamed back while the command runs. With cache_ttl set, successful
+    outputs are shared between all clients for that many seconds, which is only
+    suitable for commands without side effects. The cache holds at most cache_bytes of
+    output, the oldest outputs are evicted first.
+
+    Example usage:
+      ```
+      import universalwrapper as uw
+
+      with uw.ExecutorServer("unix:///run/uw.sock", max_workers=4, rate=20):
+          ...  # or run `uw-executor unix:///run/uw.sock` as a service
+      ```
+    """
+
+    def __init__(
+        self,
+        address: str,
+        max_workers: int = 8,
+        rate: float = 0,
+        cache_ttl: float = 0,
+        cache_bytes: int = 64 * 1024 * 1024,
+    ) -> None:
+        """Configures the daemon, call start or serve_forever to start it
+
+        :param address: unix:// address or path of the socket to listen on
+        :param max_workers: maximum number of commands that run at the same time
+        :param rate: maximum number of commands started per second, 0 = unlimited
+        :param cache_ttl: seconds to share successful outputs, 0 = no caching
+        :param cache_bytes: maximum size of the cached outputs
+        """
+        self.path = _socket_path(address)
+        self.max_workers = max_workers
+        self.rate = rate
+        self.cache_ttl = cache_ttl
+        self.cache_bytes = cache_bytes
+        self._slots = Semaphore(max_workers)
+        self._rate_lock = Lock()
+        self._next_start = 0.0
+        self._cache = {}  # {request key: (expiry, stdout, stderr)}, oldest first
+        self._cache_size = 0  # bytes of stdout and stderr in the cache
+        self._cache_lock = Lock()
+        self._sock = None
+
+    def start(self) -> "ExecutorServer":
+        """Starts serving in a background thread
+
+        :returns: self
+        """
+        self._listen()
+        Thread(target=self._serve, daemon=True).start()
+        return self
+
+    def serve_forever(self) -> None:
+        """Serves in the foreground until close is called"""
+        self._listen()
+        self._serve()
+
+    def close(self) -> None:
+        """Stops accepting new clients, running commands are finished"""
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)  # wakes up accept
+            except OSError:
+                pass
+            self._sock.close()
+            self._sock = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def __enter__(self) -> "ExecutorServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _listen(self) -> None:
+        """Binds the socket, a stale socket file of a previous daemon is replaced.
+        Other files are never removed.
+        """
+        try:
+            mode = os.lstat(self.path).st_mode
+        except FileNotFoundError:
+            mode = None
+        if mode is not None and not stat.S_ISSOCK(mode):
+            raise OSError(errno.EEXIST, "Not a socket", self.path)
+        if mode is not None:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                try:
+                    probe.connect(self.path)
+                except OSError:
+                    os.unlink(self.path)  # nothing is listening
+                else:
+                    raise OSError(
+                        errno.EADDRINUSE, "An executor is already running", self.path
+                    )
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        self._sock.listen(128)
+
+    def _serve(self) -> None:
+        """Accepts clients until the socket is closed, each client gets a thread"""
+        sock = self._sock
+        while True:
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                return
+            Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn: socket.socket) -> None:
+        """Runs the request of a client and streams back the output
+
+        :param conn: connection to the client
+        """
+        with conn:
+            kind, payload = _recv_frame(conn)
+            if kind != b"r":
+                return
+            request = json.loads(payload)
+            key = json.dumps(
+                [request["cmd"], request["cwd"], request["env"]], sort_keys=True
+            )
+            cached = self._cache_get(key)
+            if cached:
+                _send_frame(conn, b"o", cached[1])
+                _send_frame(conn, b"e", cached[2])
+                status = {"returncode": 0, "timed_out": False}
+                _send_frame(conn, b"x", json.dumps(status).encode())
+                return
+            with self._slots:
+                self._throttle()
+                status, stdout, stderr = self._run(conn, request)
+            if self.cache_ttl and status.get("returncode") == 0:
+                self._cache_put(key, stdout, stderr)
+            try:
+                _send_frame(conn, b"x", json.dumps(status).encode())
+            except OSError:
+                pass
+
+    def _cache_get(self, key: str) -> tuple:
+        """Looks up a cached output, removing it if it expired
+
+        :param key: key of the request
+        :returns: (expiry, stdout, stderr) or None
+        """
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] <= time.monotonic():
+                self._cache_evict(key)
+                return None
+            return cached
+
+    def _cache_put(self, key: str, stdout: bytes, stderr: bytes) -> None:
+        """Caches an output, after evicting the expired outputs and, if the cache is
+        full, the oldest outputs
+
+        :param key: key of the request
+        :param stdout: output of the command
+        :param stderr: error output of the command
+        """
+        size = len(stdout) + len(stderr)
+        if size > self.cache_bytes:
+            return
+        now = time.monotonic()
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache_evict(key)
+            for old in [old for old, value in self._cache.items() if value[0] <= now]:
+                self._cache_evict(old)
+            while self._cache and self._cache_size + size > self.cache_bytes:
+                self._cache_evict(next(iter(self._cache)))
+            self._cache[key] = (now + self.cache_ttl, stdout, stderr)
+            self._cache_size += size
+
+    def _cache_evict(self, key: str) -> None:
+        """Removes an output from the cache, the cache lock must be held
+
+        :param key: key of the request
+        """
+        _, stdout, stderr = self._cache.pop(key)
+        self._cache_size -= len(stdout) + len(stderr)
+
+    def _throttle(self) -> None:
+        """Waits until the next command may start according to rate"""
+        if not self.rate:
+            return
+        with self._rate_lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + 1 / self.rate
+        time.sleep(start - now)
+
+    def _run(self, conn: socket.socket, request: dict) -> tuple:
+        """Runs the command in its own process group and forwards its output to the
+        client. The command is terminated if the client hangs up or the timeout passes.
+
+        :param conn: connection to the client
+        :param request: cmd, cwd, env, timeout and timeout_grace of the call
+        :returns: exit status for the client, stdout and stderr
+        """
+        try:
+            proc = subprocess.Popen(
+                request["cmd"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=request["cwd"],
+                env=request["env"],
+                start_new_session=True,
+            )
+        except OSError as error:
+            status = {
+                "errno": error.errno,
+                "strerror": error.strerror,
+                "filename": error.filename,
+            }
+            return status, b"", b""
+        send_lock = Lock()
+        outputs = {b"o": io.BytesIO(), b"e": io.BytesIO()}
+        cache_ttl = self.cache_ttl
+
+        class _Forward:
+            """Sends every chunk that is written to the client"""
+
+            def __init__(self, kind: bytes) -> None:
+                self.kind = kind
+
+            def write(self, chunk: bytes) -> None:
+                if cache_ttl:
+                    outputs[self.kind].write(chunk)
+                try:
+                    with send_lock:
+                        _send_frame(conn, self.kind, chunk)
+                except OSError:  # the client hung up
+                    _signal(proc, _SIGKILL, True)
+
+        readers = [
+            Thread(target=_drain, args=(proc.stdout, _Forward(b"o")), daemon=True),
+            Thread(target=_drain, args=(proc.stderr, _Forward(b"e")), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+        timed_out = False
+        try:
+            proc.wait(request["timeout"])
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            _signal(proc, signal.SIGTERM, True)
+            try:
+                proc.wait(request["timeout_grace"])
+            except subprocess.TimeoutExpired:
+                pass
+            _signal(proc, _SIGKILL, True)
+            proc.wait()
+        for reader in readers:
+            reader.join()
+        status = {"returncode": proc.returncode, "timed_out": timed_out}
+        return status, outputs[b"o"].getvalue(), outputs[b"e"].getvalue()
+
+
+def help_index(wrapper: UniversalWrapper) -> HelpIndex:
+    """Returns the subcommands and flags of a wrapped command, e.g. to check if a chain
+    of subcommands exists before calling it. The help text is only generated when it is
+    not in the on-disk cache.
+
+    :param wrapper: wrapped command, e.g. `git.remote`
+    :returns: HelpIndex
+    """
+    return wrapper._help_index()
+
+
+def _cache_dir(cache_dir: str = None) -> str:
+    """Returns the directory for on-disk caches
+
+    :param cache_dir: configured cache_dir, if any
+    :returns: path of the cache directory
+    """
+    if cache_dir:
+        return cache_dir
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "universalwrapper")
+
+
+def _help_cache_path(uw_settings: UWSettings) -> str:
+    """Returns the path of the cached help text of a command. The path depends on the
+    executable, its modification time and the chain of subcommands, so the cache is
+    invalidated when the executable is updated.
+
+    :param uw_settings: settings of the wrapped command
+    :returns: path of the cache file, or None if the executable is not found
+    """
+    executable = uw_settings.cmd.split(" ")[0]
+    env = uw_settings.env if isinstance(uw_settings.env, dict) else os.environ
+    try:
+        if os.sep not in executable:
+            executable = _which(executable, env.get("PATH", os.defpath))
+        mtime = os.stat(executable).st_mtime_ns
+    except OSError:
+        return None
+    key = json.dumps([executable, mtime, uw_settings.cmd])
+    name = f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+    return os.path.join(_cache_dir(uw_settings.cache_dir), "help", name)
+
+
+def _digest_paths(paths: List[str], cwd: str) -> str:
+    """Computes a hash of the contents of files and directories
+
+    :param paths: files or directories, relative to cwd
+    :param cwd: directory to resolve relative paths from
+    :returns: hex digest
+    """
+    digest = hashlib.sha256()
+    for path in sorted(paths or []):
+        path = os.path.join(cwd, path)
+        files = [path]
+        if os.path.isdir(path):
+            files = sorted(
+                os.path.join(root, name)
+                for root, _, names in os.walk(path)
+                for name in names
+            )
+        for name in files:
+            digest.update(os.fsencode(os.path.relpath(name, cwd)) + b"\x00")
+            try:
+                with open(name, "rb") as file:
+                    for chunk in iter(lambda: file.read(1 << 20), b""):
+                        digest.update(chunk)
+            except OSError:
+                digest.update(b"\x00missing")
+    return digest.hexdigest()
+
+
+def _drain(stream, buffer) -> None:
+    """Writes everything that is read from stream to buffer until EOF
+
+    :param stream: binary file object, e.g. the stderr pipe of a subprocess
+    :param buffer: object with a write method, e.g. BytesIO or _TailBuffer
+    """
+    with stream:
+        for chunk in iter(lambda: stream.read1(65536), b""):
+            buffer.write(chunk)
+
+
+def _signal(proc: subprocess.Popen, sig: int, group: bool) -> None:
+    """Sends a signal to a process, or to its process group
+
+    :param proc: the subprocess, either subprocess.Popen or asyncio.subprocess.Process
+    :param sig: signal to send
+    :param group: True to signal the process group, the process must have been started
+    in its own process group, see _PROCESS_GROUP
+    """
+    try:
+        if group and hasattr(os, "killpg"):
+            os.killpg(proc.pid, sig)
+        elif proc.returncode is None:
+            proc.send_signal(sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _shared_limiter(key: str) -> _Limiter:
+    """Returns the limiter of a limit_key, shared by all wrappers
+
+    :param key: limit_key of the call, or its command
+    :returns: the limiter
+    """
+    with _LIMITERS_LOCK:
+        if key not in _LIMITERS:
+            _LIMITERS[key] = _Limiter()
+        return _LIMITERS[key]
+
+
+def _reactor() -> _Reactor:
+    """Returns the reactor shared by all wrappers, starting it on first use
+
+    :returns: the reactor
+    """
+    global _REACTOR
+    with _REACTOR_LOCK:
+        if _REACTOR is None:
+            _REACTOR = _Reactor()
+        return _REACTOR
+
+
+def _pidfd_supported() -> bool:
+    """Checks once whether os.pidfd_open is available, it requires Linux 5.3
+
+    :returns: True if pidfds can be used
+    """
+    global _PIDFD_SUPPORTED
+    if _PIDFD_SUPPORTED is None:
+        try:
+            os.close(os.pidfd_open(os.getpid()))
+            _PIDFD_SUPPORTED = True
+        except (AttributeError, OSError):
+            _PIDFD_SUPPORTED = False
+    return _PIDFD_SUPPORTED
+
+
+def _fixture(path: str, backend: str) -> _Fixture:
+    """Returns the fixture of a backend, shared by all wrappers
+
+    :param path: path of the fixture
+    :param backend: "record" or "replay"
+    :returns: the fixture
+    """
+    key = (os.path.abspath(path), backend)
+    with _FIXTURES_LOCK:
+        if key not in _FIXTURES:
+            _FIXTURES[key] = _Fixture(path, backend)
+        return _FIXTURES[key]
+
+
+def _fixture_key(cmd: List[str], cwd: str, env: dict) -> str:
+    """Returns the key that identifies a recorded call
+
+    :param cmd: List of string which combined make the shell command
+    :param cwd: configured working directory of the call
+    :param env: identifying env variables of the call
+    :returns: key of the call
+    """
+    return json.dumps([cmd, cwd, env], sort_keys=True)
+
+
+def _socket_path(address: str) -> str:
+    """Returns the path of the socket of an executor address
+
+    :param address: unix:///path/to/socket or /path/to/socket
+    :returns: /path/to/socket
+    """
+    if "://" not in address:
+        return address
+    scheme, path = address.split("://", 1)
+    if scheme != "unix":
+        raise ValueError(f"Unsupported executor {address}, use unix:///path/to/socket")
+    return path
+
+
+def _send_frame(sock: socket.socket, kind: bytes, payload: bytes) -> None:
+    """Sends a frame of the executor protocol
+
+    :param sock: connected socket
+    :param kind: b"r" request, b"o" stdout, b"e" stderr or b"x" exit status
+    :param payload: content of the frame
+    """
+    sock.sendall(_FRAME.pack(kind, len(payload)) + payload)
+
+
+def _recv_frame(sock: socket.socket) -> tuple:
+    """Receives a frame of the executor protocol, see _send_frame
+
+    :param sock: connected socket
+    :returns: kind and payload of the frame, kind is None if the peer hung up
+    """
+    header = _recv_exact(sock, _FRAME.size)
+    if header is None:
+        return None, b""
+    kind, size = _FRAME.unpack(header)
+    payload = _recv_exact(sock, size)
+    if payload is None:
+        return None, b""
+    return kind, payload
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    """Receives exactly size bytes
+
+    :param sock: connected socket
+    :param size: number of bytes to receive
+    :returns: the received bytes, None if the peer hung up before
+    """
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(min(size - len(buffer), 1 << 20))
+        if not chunk:
+            return None
+        buffer += chunk
+    return bytes(buffer)
+
+
+def _executor_main() -> None:
+    """Entry point of the uw-executor command"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description=ExecutorServer.__doc__.split("\n\n")[0]
+    )
+    parser.add_argument("address", help="e.g. unix:///run/uw.sock")
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=0, help="commands per second")
+    parser.add_argument("--cache-ttl", type=float, default=0, help="seconds")
+    parser.add_argument("--cache-bytes", type=int, default=64 * 1024 * 1024)
+    args = parser.parse_args()
+    server = ExecutorServer(
+        args.address, args.max_workers, args.rate, args.cache_ttl, args.cache_bytes
+    )
+    signal.signal(signal.SIGTERM, lambda *_: server.close())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.close()
+
+
+def _which(command: str, path: str) -> str:
+    """Looks up the absolute path of an executable, using a cache per PATH
+
+    :param command: name of the executable
+    :param path: PATH to search the executable in
+    :returns: absolute path of the executable
+    """
+    key = (command, path)
+    if key not in _WHICH_CACHE:
+        executable = shutil.which(command, path=path)
+        if executable is None:
+            raise FileNotFoundError(
+                errno.ENOENT, f"No such file or directory in PATH: {command!r}", command
+            )
+        _WHICH_CACHE[key] = executable
+    return _WHICH_CACHE[key]
+
+
+def _overlay_env(env: Union[dict, None], overlay: dict) -> Dict[str, str]:
+    """Merges overlay onto env, or onto the inherited environment if env is None. The
+    merge with the inherited environment is cached per overlay and only redone when
+    os.environ changed, so repeated calls with the same overlay share one read-only
+    environment.
+
+    :param env: environment to merge the overlay onto, None for os.environ
+    :param overlay: {variable: value} to add or replace
+    :returns: merged environment
+    """
+    if env is not None:
+        return {**env, **overlay}
+    key = tuple(sorted(overlay.items()))
+    snapshot = getattr(os.environ, "_data", os.environ)
+    cached = _ENV_CACHE.get(key)
+    if cached is None or cached[0] != snapshot:
+        if len(_ENV_CACHE) > 128:
+            _ENV_CACHE.clear()
+        cached = (dict(snapshot), MappingProxyType({**os.environ, **overlay}))
+        _ENV_CACHE[key] = cached
+    return cached[1]
+
+
+def _arg_max() -> int:
+    """Returns the number of bytes available for the arguments and environment of a
+    new process, leaving some headroom like xargs does
+
+    :returns: Size limit in bytes
+    """
+    try:
+        arg_max = os.sysconf("SC_ARG_MAX")
+    except (AttributeError, ValueError, OSError):
+        arg_max = 32767  # Windows command line limit
+    if arg_max <= 0:
+        arg_max = 131072  # POSIX minimum
+    return arg_max - 2048
+
+
+def _arg_size(arg: str) -> int:
+    """Returns the number of bytes an argument occupies in the argument block
+
+    :param arg: argument or environment entry
+    :returns: size of the string including terminator and pointer
+    """
+    return len(os.fsencode(arg)) + 1 + 8
+
+
+def _merge_outputs(outputs: list, parser: str = "") -> Union[str, bytes, dict, list]:
+    """Merges the outputs of a chunked call in order
+
+    :param outputs: outputs of the chunks
+    :param parser: output_parser of the call, tables are merged column by column
+    :returns: merged output
+    """
+    if len(outputs) == 1:
+        return outputs[0]
+    if parser == "table":
+        return _merge_tables(outputs)
+    if all(isinstance(output, LineIndex) for output in outputs):
+        data = [output._data for output in outputs if output._data]
+        return LineIndex(
+            b"".join(part if part.endswith(b"\n") else part + b"\n" for part in data),
+            outputs[0]._encoding,
+        )
+    if all(isinstance(output, str) for output in outputs):
+        return "".join(outputs)
+    if all(isinstance(output, bytes) for output in outputs):
+        return b"".join(outputs)
+    if all(isinstance(output, list) for output in outputs):
+        return [item for output in outputs for item in output]
+    if all(isinstance(output, dict) for output in outputs):
+        return {key: value for output in outputs for key, value in output.items()}
+    return outputs
+
+
+def _merge_tables(tables: List[dict]) -> Dict[str, list]:
+    """Concatenates the columns of tables, see _parse_table. Columns that are missing
+    in a table are filled with empty values.
+
+    :param tables: tables in order
+    :returns: merged table
+    """
+    names = list(dict.fromkeys(name for table in tables for name in table))
+    columns = {name: [] for name in names}
+    for table in tables:
+        rows = len(next(iter(table.values()), []))
+        for name in names:
+            columns[name].append(table[name] if name in table else [""] * rows)
+    if numpy is not None:
+        return {name: numpy.concatenate(parts) for name, parts in columns.items()}
+    return {
+        name: [value for part in parts for value in part]
+        for name, parts in columns.items()
+    }
+
+
+def _parse(parser: str, output: ByteString):
+    """Parses the output of a shell call. This is a module level function, such that it
+    can be sent to the parse pool.
+
+    :param parser: name of the parser, see UWSettings.output_parser
+    :param output: subprocess output
+    :returns: parsed output
+    """
+    options = ["yaml", "json", "splitlines", "lines", "table", "auto"]
+    if not parser in options:
+        raise ValueError(f"{parser} is not a valid parser, choose from {options}")
+
+    if parser == "lines":
+        return LineIndex(output)
+    output = output.decode()
+    if parser == "yaml":
+        return yaml.safe_load(output)
+    elif parser == "json":
+        return json.loads(output)
+    elif parser == "splitlines":
+        return output.splitlines()
+    elif parser == "table":
+        return _parse_table(output)
+    elif parser == "auto":
+        try:
+            return json.loads(output)
+        except json.decoder.JSONDecodeError:
+            pass
+        try:
+            parsed = yaml.safe_load(output)
+            if isinstance(parsed, list) or isinstance(parsed, dict):
+                return parsed
+        except yaml.YAMLError:
+            pass
+        return output
+
+
+def _crlf_anchors(pattern: bytes) -> bytes:
+    """Rewrites the "$" anchors of a regular expression to also match before a "\\r"
+    that precedes the end of the line, escaped "$" and "$" in sets are left as is
+
+    :param pattern: regular expression
+    :returns: rewritten regular expression
+    """
+    output, escaped, in_set = bytearray(), False, False
+    for char in pattern:
+        if escaped:
+            escaped = False
+        elif char == ord("\\"):
+            escaped = True
+        elif char == ord("[") and not in_set:
+            in_set = True
+        elif char == ord("]") and in_set:
+            in_set = False
+        elif char == ord("$") and not in_set:
+            output += rb"(?=\r?$)"
+            continue
+        output.append(char)
+    return bytes(output)
+
+
+def _parse_pool(kind: str) -> Executor:
+    """Returns the shared pool for parsing large outputs, creating it on first use
+
+    :param kind: "thread" or "process"
+    :returns: the pool
+    """
+    with _PARSE_POOLS_LOCK:
+        if kind not in _PARSE_POOLS:
+            if kind == "thread":
+                _PARSE_POOLS[kind] = ThreadPoolExecutor(thread_name_prefix="uw-parse")
+            elif kind == "process":
+                _PARSE_POOLS[kind] = ProcessPoolExecutor()
+            else:
+                raise ValueError(
+                    f"{kind} is not a valid pool, choose thread or process"
+                )
+        return _PARSE_POOLS[kind]
+
+
+def _parse_table(output: str) -> Dict[str, list]:
+    """Parses whitespace aligned tables, like the output of ps, df or docker ps, into
+    columns. The column boundaries are detected once from the positions that are blank
+    in every line, after which each column is sliced out of the lines in one go. Blank
+    positions within a header (e.g. "CONTAINER ID") or within the values of a column
+    (e.g. "Up 2 hours") do not split the column. Wide right-aligned values can fill
+    the blanks between columns (e.g. "VSZ   RSS TTY" in ps aux), such spans are split
+    at the headers in them and each value goes to the header it lines up with.
+
+    Columns of which all values are numeric are converted to int or float. If NumPy is
+    available, the columns are returned as NumPy arrays.
+
+    :param output: decoded output of the shell call
+    :returns: {header: column values}
+    """
+    lines = [line.rstrip() for line in output.expandtabs().splitlines()]
+    lines = [line for line in lines if line]
+    if not lines:
+        return {}
+    occupied = bytearray(max(len(line) for line in lines))
+    for line in lines:
+        for match in re.finditer(r"\S+", line):
+            occupied[match.start() : match.end()] = b"\x01" * len(match.group())
+    header, body = lines[0], lines[1:]
+    spans = []
+    for match in re.finditer(b"\x01+", bytes(occupied)):
+        if spans and not header[match.start() : match.end()].strip():
+            spans[-1][1] = match.end()  # no header of its own: part of the previous
+        else:
+            spans.append(list(match.span()))
+    tokens = [match.span() for match in re.finditer(r"\S+", header)]
+    words = [[match.span() for match in re.finditer(r"\S+", line)] for line in body]
+
+    columns = []  # [(header start, header end, values)]
+    for start, end in spans:
+        groups = _table_groups(
+            [token for token in tokens if start <= token[0] < end], words
+        ) or [(start, end)]
+        if len(groups) == 1:
+            values = [line[start:end].strip() for line in body]
+            columns.append((*groups[0], values))
+            continue
+        cells = [[] for _ in groups]
+        for line, line_words in zip(body, words):
+            found = [[] for _ in groups]
+            group = 0
+            for word in line_words:
+                if word[1] > start and word[0] < end:
+                    group = _table_group(groups, word, group)
+                    found[group].append(word)
+            for cell, value in zip(cells, found):
+                cell.append(line[value[0][0] : value[-1][1]] if value else "")
+        columns += [(*group, cell) for group, cell in zip(groups, cells)]
+
+    table = {}
+    previous = None
+    for start, end, values in columns:
+        name = header[start:end].strip()
+        if previous and body and not any(values) and not header[:start].endswith("  "):
+            del table[previous[0]]  # a header with a blank, e.g. "Mounted on"
+            start, values = previous[1], previous[2]
+            name = header[start:end].strip()
+        while name in table:
+            name += "_"
+        table[name] = values
+        previous = (name, start, values)
+    return {name: _typed_column(values) for name, values in table.items()}
+
+
+def _table_groups(tokens: List[tuple], words: List[List[tuple]]) -> List[tuple]:
+    """Groups the header words of a table column span into columns. Header words are
+    separate columns if a line has a value under each of them, otherwise they are
+    one header with a blank, e.g. "CONTAINER ID".
+
+    :param tokens: (start, end) of the header words in the span
+    :param words: (start, end) of the words of every line of the table body
+    :returns: (start, end) of the header of every column
+    """
+    separate = set()  # i if tokens i and i + 1 are separate columns
+    for line_words in words:
+        owners = set()
+        for word_start, word_end in line_words:
+            hits = [
+                i
+                for i, (start, end) in enumerate(tokens)
+                if word_start < end and start < word_end
+            ]
+            if len(hits) == 1:
+                owners.add(hits[0])
+        separate.update(i for i in owners if i + 1 in owners)
+    groups = []
+    for i, token in enumerate(tokens):
+        if groups and i - 1 not in separate:
+            groups[-1] = (groups[-1][0], token[1])
+        else:
+            groups.append(token)
+    return groups
+
+
+def _table_group(groups: List[tuple], word: tuple, first: int) -> int:
+    """Finds the column of a value: the first header it overlaps, which is where
+    right-aligned values end and left-aligned values start, or else the closest
+    header. Values that are wider than their column push the later values to the
+    right, so a value never goes to a column before that of the previous value.
+
+    :param groups: (start, end) of the header of every column in the span
+    :param word: (start, end) of the value
+    :param first: column of the previous value of the line
+    :returns: index of the column
+    """
+    distances = [max(start - word[1], word[0] - end, -1) for start, end in groups]
+    return distances.index(min(distances[first:]), first)
+
+
+def _typed_column(values: List[str]) -> list:
+    """Converts the values of a table column to int or float if they all are numeric
+
+    :param values: values of a column
+    :returns: converted column, as NumPy array if NumPy is available
+    """
+    for cast in (int, float):
+        try:
+            values = [cast(value) for value in values]
+            break
+        except ValueError:
+            continue
+    if numpy is not None:
+        return numpy.array(values)
+    return values
+
+
 def __getattr__(attr):
     """Redirects all traffic to UniversalWrapper"""
     return UniversalWrapper(attr)